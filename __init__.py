@@ -3,12 +3,26 @@
 # http://internetimagery.com
 
 import re
+import copy
+import zlib
+import json
+import jobs
+import base64
 import report
+import verify
+import simplify
+import bisect
+import time
+import shutil
+import hashlib
 import os.path
 import datetime
+import tempfile
+import contextlib
 import webbrowser
 import unicodedata
 import collections
+import multiprocessing.pool
 import maya.mel as mel
 import maya.cmds as cmds
 try:
@@ -17,29 +31,169 @@ except ImportError:
     import pickle
 
 class Node(object):
-    """ Store Data in Object """
-    def __init__(s, name):
+    """
+    Store Data in Object. One record per key, each on its own attribute, plus an index.
+    Records are compressed json, decoded only when asked for. Cached in memory and written back when idle.
+    """
+    INDEX = "index" # Attribute listing records as key : [prefix, clip count]
+    SCHEMA = "schema" # Attribute holding the schema version. Older scenes are migrated when loaded
+    LEGACY = "notes" # Attribute everything was pickled into, before records
+    def __init__(s, name, legacy=None):
         s.name = name
-        s._data = {}
-    @property
-    def data(s):
+        s.legacy = legacy # Pattern matching fileInfo keys to migrate
+        s._index = None # Cached index. None = read from the scene
+        s._records = {} # Key : decoded record
+        s._raw = {} # Attribute : last string read from / written to the scene
+        s._dirty = set() # Keys to write (or delete) on flush
+        s._pending = False # Is a write waiting for idle?
+        s._sceneJobs = []
+        s._attrJobs = {} # Attribute : job
+    def index(s):
+        if s._index is None:
+            s.watch()
+            s._records = {}
+            s._raw = {}
+            s._index = decodeRecord(s.read(s.INDEX)) or {}
+            if s.read(s.SCHEMA) != str(SCHEMA):
+                s.migrate()
+        return s._index
+    def get(s, key):
+        """ Record for a key. Only this record is decoded """
+        if key not in s.index():
+            return {}
+        if key not in s._records:
+            s._records[key] = decodeRecord(s.read(key)) or {}
+        return s._records[key]
+    def set(s, key, data):
+        s.stage(key, data)
+        s.save()
+    def stage(s, key, data):
+        """ Change a record, to be written with the next save """
+        s.index()[key] = [data.get("pref"), len(data.get("anim", []))]
+        s._records[key] = data
+        s._dirty.add(key)
+    def remove(s, key):
+        if key in s.index():
+            del s._index[key]
+            s._records.pop(key, None)
+            s._dirty.add(key)
+            s.save()
+    def read(s, attr):
+        try:
+            s._raw[attr] = cmds.getAttr("%s.%s" % (s.name, attr))
+        except ValueError:
+            s._raw[attr] = None
+        return s._raw[attr]
+    def migrate(s):
+        """
+        Bring in data from older versions: the pickle on "notes" and json in fileInfo.
+        Only read, so opening a scene doesn't modify it. The records are written, with the schema
+        version, on the next real save. The old data is left for older versions of the tool.
+        """
+        raw = s.read(s.LEGACY)
+        if raw:
+            try:
+                legacy = pickle.loads(str(raw))
+            except (ValueError, pickle.UnpicklingError):
+                legacy = {}
+            for key, data in legacy.items():
+                if key not in s._index and data:
+                    s.stage(key, data)
+        if s.legacy:
+            info = cmds.fileInfo(q=True) or [] # [key, value, key, value ...]
+            for key, value in zip(info[::2], info[1::2]):
+                if s.legacy.match(key):
+                    data = decodeLegacy(value)
+                    if key not in s._index and data:
+                        s.stage(key, data)
+    def watch(s):
+        """ Drop our cache when the scene or the node changes """
+        if not s._sceneJobs:
+            for event in ("SceneOpened", "PostSceneRead", "NewSceneOpened"):
+                s._sceneJobs.append(cmds.scriptJob(e=[event, s.invalidate]))
+        if cmds.objExists(s.name):
+            for attr in cmds.listAttr(s.name, ud=True) or []:
+                if attr in s._attrJobs and cmds.scriptJob(ex=s._attrJobs[attr]):
+                    continue
+                s._attrJobs[attr] = cmds.scriptJob(ac=["%s.%s" % (s.name, attr), lambda a=attr: s.changed(a)])
+    def changed(s, attr):
+        """ Attribute changed. Ignore our own writes """
         try:
-            s._data = pickle.loads(str(cmds.getAttr("%s.notes" % s.name)))
-        except (ValueError, pickle.UnpicklingError):
-            s._data = {}
-        return s._data
+            raw = cmds.getAttr("%s.%s" % (s.name, attr))
+        except ValueError:
+            raw = None
+        if raw != s._raw.get(attr):
+            s.invalidate()
+    def invalidate(s):
+        s._index = None
+        s._records = {}
+        s._dirty = set()
+        s._pending = False # Pending changes belonged to the old data
     def check(s):
         if not cmds.objExists(s.name):
             sel = cmds.ls(sl=True)
             s.name = cmds.group(n=s.name, em=True)
             cmds.select(sel, r=True)
-        if not cmds.attributeQuery("notes", n=s.name, ex=True):
-            cmds.addAttr(s.name, ln="notes", sn="nts", dt="string", s=True)
     def save(s):
-        s.check()
-        cmds.setAttr("%s.notes" % s.name, l=False) # unlock attribute
-        cmds.setAttr("%s.notes" % s.name, pickle.dumps(s._data, 0), type="string", l=True)
-STORE = Node("GameExportData")
+        """ Queue a write. Many saves before idle become one write """
+        if not s._pending:
+            s._pending = True
+            if cmds.about(b=True): # No idle queue in batch mode
+                s.flush()
+            else:
+                cmds.evalDeferred(s.flush, lp=True)
+    def flush(s):
+        """ Write changed records and the index into the scene """
+        if s._pending and s._index is not None:
+            s._pending = False
+            s.check()
+            for key in s._dirty:
+                if key in s._index:
+                    s.write(key, encodeRecord(s._records[key]))
+                else:
+                    s.delete(key)
+            s._dirty = set()
+            s.write(s.INDEX, encodeRecord(s._index))
+            if s._raw.get(s.SCHEMA) != str(SCHEMA):
+                s.write(s.SCHEMA, str(SCHEMA))
+            s.watch()
+    def write(s, attr, text):
+        plug = "%s.%s" % (s.name, attr)
+        if not cmds.attributeQuery(attr, n=s.name, ex=True):
+            cmds.addAttr(s.name, ln=attr, dt="string", s=True)
+        s._raw[attr] = text
+        cmds.setAttr(plug, l=False) # unlock attribute
+        cmds.setAttr(plug, text, type="string", l=True)
+    def delete(s, attr):
+        if cmds.attributeQuery(attr, n=s.name, ex=True):
+            job = s._attrJobs.pop(attr, None)
+            if job and cmds.scriptJob(ex=job):
+                cmds.scriptJob(k=job, f=True)
+            s._raw.pop(attr, None)
+            cmds.setAttr("%s.%s" % (s.name, attr), l=False)
+            cmds.deleteAttr("%s.%s" % (s.name, attr))
+
+SCHEMA = 1 # Version of the store layout. Scenes without it have legacy data to migrate
+RECORD_VERSION = 1 # Records are "version:data"
+
+def encodeRecord(data):
+    return "%s:%s" % (RECORD_VERSION, base64.b64encode(zlib.compress(json.dumps(data, separators=(",", ":")), 9)))
+
+def decodeRecord(text):
+    """ Decode a record. None if there isn't one or we can't read it """
+    if text:
+        version, _, body = text.partition(":")
+        if version == str(RECORD_VERSION):
+            try:
+                return json.loads(zlib.decompress(base64.b64decode(body)))
+            except (TypeError, ValueError, zlib.error):
+                pass
+    return None
+
+CHARACTER = "GameAnimExportData" # Base name for character entries
+characterKey = re.compile(r"^%s(\d+)$" % CHARACTER)
+
+STORE = Node("GameExportData", characterKey)
 
 def title(text):
     cmds.text(l=text, al="left", h=30)
@@ -58,71 +212,314 @@ def relativePath(path):
     return absolutePath(path).replace("\\", "/") if rPath[:2] == ".." else rPath.replace("\\", "/")
 
 # Loading data from old datatype for backwards compatibility
-import json
-def loadLegacy(dataName):
+def decodeLegacy(text):
     try:
-        return json.loads(cmds.fileInfo(dataName, q=True)[0].decode("unicode_escape"))
-    except (ValueError, IndexError):
+        return json.loads(text.decode("unicode_escape"))
+    except ValueError:
         return {}
 
 def loadInfo(dataName):
-    return STORE.data.get(dataName, {}) or loadLegacy(dataName)
+    return STORE.get(dataName)
 
 def saveInfo(dataName, data):
-    STORE.data[dataName] = data
-    STORE.save()
+    STORE.set(dataName, data)
+
+def removeInfo(dataName):
+    STORE.remove(dataName)
+
+def characterIndex():
+    """
+    List characters as (key, prefix, clip count) from the store index.
+    Slots do not need to be contiguous.
+    """
+    store = STORE.index()
+    index = []
+    for key in sorted((k for k in store if characterKey.match(k)), key=lambda x: int(characterKey.match(x).group(1))):
+        pref, count = store[key]
+        if pref:
+            index.append((key, pref, count))
+    return index
+
+def newCharacterKey(index):
+    """ Next free character slot, given the results of characterIndex """
+    last = max([int(characterKey.match(k).group(1)) for k, p, c in index] or [0])
+    return CHARACTER + str(last + 1)
+
+class LayerCache(object):
+    """
+    Animation layer tree with mute / solo state.
+    Read once, then only again once layers are added, removed, renamed, muted or soloed.
+    """
+    def __init__(s):
+        s._layers = None
+        s._state = None
+        s._sceneJobs = []
+        s._layerJobs = []
+    @property
+    def layers(s):
+        if s._layers is None:
+            s._layers = s.read()
+            s._state = None
+            s.watch()
+        return s._layers
+    @property
+    def state(s): # Current layer settings, comparable with layerState
+        layers = s.layers
+        if s._state is None:
+            s._state = layerState({
+                "solo" : [l for l in layers if layers[l]["solo"]],
+                "mute" : [l for l in layers if layers[l]["mute"]]
+                })
+        return s._state
+    def read(s):
+        rootLayer = cmds.animLayer(q=True, r=True)
+        if rootLayer:
+            def search(layer, depth=0):
+                children = cmds.animLayer(layer, q=True, c=True)
+                if children:
+                    for child in children:
+                        layers[child] = {"depth" : depth}
+                        search(child, depth+1)
+            layers = collections.OrderedDict()
+            search(rootLayer)
+            if layers:
+                for layer in layers:
+                    mute = cmds.animLayer(layer, q=True, m=True)
+                    solo = cmds.animLayer(layer, q=True, s=True)
+                    layers[layer]["mute"] = mute
+                    layers[layer]["solo"] = solo
+                return layers
+        return {}
+    def watch(s):
+        if not s._sceneJobs:
+            for event in ("SceneOpened", "PostSceneRead", "NewSceneOpened", "NameChanged", "animLayerRebuild"):
+                s._sceneJobs.append(cmds.scriptJob(e=[event, s.invalidate]))
+        for job in s._layerJobs: # Clear out jobs for the old layers
+            if cmds.scriptJob(ex=job):
+                cmds.scriptJob(k=job, f=True)
+        s._layerJobs = []
+        for layer in s._layers:
+            for attr in ("mute", "solo"):
+                s._layerJobs.append(cmds.scriptJob(
+                    ac=["%s.%s" % (layer, attr), lambda l=layer, a=attr: s.changed(l, a)]))
+    def changed(s, layer, attr):
+        """ Layer attribute changed. Ignore it if the cache already matches """
+        if s._layers is not None:
+            try:
+                if s._layers[layer][attr] == cmds.getAttr("%s.%s" % (layer, attr)):
+                    return
+            except (KeyError, ValueError):
+                pass
+        s.invalidate()
+    def invalidate(s):
+        s._layers = None
+    def set(s, layer, attr, value): # Change a layer, keeping the cache in step. Cache first, so its change job matches
+        s._layers[layer][attr] = value
+        s._state = None
+        cmds.animLayer(layer, e=True, **{attr : value})
+LAYERS = LayerCache()
 
 def getAllLayers():
-    rootLayer = cmds.animLayer(q=True, r=True)
-    if rootLayer:
-        def search(layer, depth=0):
-            children = cmds.animLayer(layer, q=True, c=True)
-            if children:
-                for child in children:
-                    layers[child] = {"depth" : depth}
-                    search(child, depth+1)
-        layers = collections.OrderedDict()
-        search(rootLayer)
-        if layers:
-            for layer in layers:
-                mute = cmds.animLayer(layer, q=True, m=True)
-                solo = cmds.animLayer(layer, q=True, s=True)
-                layers[layer]["mute"] = mute
-                layers[layer]["solo"] = solo
-            return layers
-    return {}
+    return LAYERS.layers
+
+class suspendRefresh(object):
+    """
+    Hold off viewport refresh (and with it evaluation) for a batch of scene changes
+    """
+    depth = 0 # Outermost suspend resumes
+    def __enter__(s):
+        if not suspendRefresh.depth:
+            cmds.refresh(su=True)
+        suspendRefresh.depth += 1
+
+    def __exit__(s, *args):
+        suspendRefresh.depth -= 1
+        if not suspendRefresh.depth:
+            cmds.refresh(su=False)
 
 def setLayers(solo=[], mute=[]): # include only layers that are on mute/solo
-    # Prep our layers
+    # Only change layers that differ from what we want
     layers = getAllLayers()
+    changes = []
     for layer in layers:
-        options = layers[layer]
-        if options["solo"]:
-            cmds.animLayer(layer, e=True, s=False)
-        if layers[layer]["mute"]:
-            cmds.animLayer(layer, e=True, m=False)
-    # Modify our layers
-    if solo:
-        for layer in solo:
-            if cmds.animLayer(layer, q=True, ex=True):
-                cmds.animLayer(layer, e=True, s=True)
-    if mute:
-        for layer in mute:
-            if cmds.animLayer(layer, q=True, ex=True):
-                cmds.animLayer(layer, e=True, m=True)
+        for attr, value in (("solo", layer in solo), ("mute", layer in mute)):
+            if layers[layer][attr] != value:
+                changes.append((layer, attr, value))
+    if changes:
+        with suspendRefresh():
+            for layer, attr, value in changes:
+                LAYERS.set(layer, attr, value)
+
+def layerState(layers): # Comparable form of an animations layer settings
+    return tuple(sorted(layers["solo"])), tuple(sorted(layers["mute"]))
+
+def applyAnimation(data): # Set up the scene to match an animation entry
+    cmds.playbackOptions(
+        e=True,
+        min=data["range"][0],
+        max=data["range"][1]
+    )
+    setLayers(
+        solo = data["layers"]["solo"],
+        mute = data["layers"]["mute"]
+    )
+
+class ClipIndex(object):
+    """
+    Find the animations playing on a frame, for the current layer settings.
+    Clips are grouped by layer state and sorted by start, so lookups are a binary search.
+    """
+    def __init__(s, anims):
+        groups = {}
+        for anim in anims:
+            groups.setdefault(layerState(anim.data["layers"]), []).append(anim)
+        s.groups = {}
+        for state, group in groups.items():
+            group.sort(key=lambda x: x.data["range"][0])
+            reach = [] # Furthest end of any clip up to this one
+            furthest = float("-inf")
+            for anim in group:
+                furthest = max(furthest, anim.data["range"][1])
+                reach.append(furthest)
+            s.groups[state] = ([a.data["range"][0] for a in group], reach, group)
+    def find(s, state, frame):
+        """ Animations with the frame inside (not on the edge of) their range """
+        found = set()
+        if state in s.groups:
+            starts, reach, group = s.groups[state]
+            i = bisect.bisect_left(starts, frame) - 1 # Last clip starting before frame
+            while 0 <= i and frame < reach[i]:
+                if frame < group[i].data["range"][1]:
+                    found.add(group[i])
+                i -= 1
+        return found
+
+def normalName(name): # Names that clash, once exported
+    return name.lower().replace(" ", "_")
+
+class ClipCatalog(object):
+    """
+    Animations of a character, kept in order of start frame with an index of their names.
+    Adding, removing and name lookups don't rescan the other animations.
+    """
+    BASENAME = "Anim_" # New animations are named BASENAME + lowest free number
+    def __init__(s, anims=()):
+        s.anims = [] # Animations, by start frame
+        s.records = [] # Their data, in the same order. Stored as is
+        s.keys = [] # Sort keys, for bisect
+        s.names = {} # Normalized name : animation
+        s.entries = {} # Animation : (sort key, normalized name), as indexed
+        s.numbers = set() # Numbers taken by BASENAME names
+        s.lowest = 1 # No free numbers below this one
+        s.count = 0 # Tie breaker, keeping insertion order
+        for anim in anims:
+            s.add(anim)
+    def add(s, anim):
+        s.count += 1
+        key = (anim.data["range"][0], s.count)
+        i = bisect.bisect(s.keys, key)
+        s.keys.insert(i, key)
+        s.anims.insert(i, anim)
+        s.records.insert(i, anim.data)
+        name = normalName(anim.data["name"])
+        s.names[name] = anim
+        s.entries[anim] = (key, name)
+        number = s.number(name)
+        if number:
+            s.numbers.add(number)
+    def remove(s, anim):
+        if anim in s.entries:
+            key, name = s.entries.pop(anim)
+            i = bisect.bisect_left(s.keys, key)
+            del s.keys[i], s.anims[i], s.records[i]
+            if s.names.get(name) is anim:
+                del s.names[name]
+            number = s.number(name)
+            if number:
+                s.numbers.discard(number)
+                s.lowest = min(s.lowest, number)
+    def update(s, anim):
+        """ Re-index an animation after its name or range changed """
+        s.remove(anim)
+        s.add(anim)
+    def number(s, name):
+        match = re.match(r"^%s(\d+)$" % normalName(s.BASENAME), name)
+        return int(match.group(1)) if match else None
+    def taken(s, name):
+        return normalName(name) in s.names
+    def freeName(s):
+        while s.lowest in s.numbers:
+            s.lowest += 1
+        return s.BASENAME + str(s.lowest)
 
 iconSize = 25 # Global icon size for all listings
+ROW_CHUNK = 40 # Rows built in one go. Longer lists finish building when Maya is idle
+
+class RowList(object):
+    """
+    Rows in a layout, kept in step with a list of items.
+    Layouts can only be added to at the end, so rows already in place are kept
+    (and updated), and only the rest are rebuilt.
+    """
+    def __init__(s, layout, build, update=None, built=None):
+        s.layout = layout
+        s.build = build # build(layout, item) -> row
+        s.update = update # update(item, row)
+        s.built = built # built(), once rows left for idle are in
+        s.items = [] # Items with rows, in order
+        s.rows = {} # Item : row
+        s.pending = [] # Items waiting on a row
+        s.scheduled = False
+    def show(s, items):
+        keep = 0
+        for built, item in zip(s.items, items):
+            if built != item:
+                break
+            keep += 1
+        for item in s.items[keep:]:
+            s.remove(item)
+        if s.update:
+            for item in s.items:
+                s.update(item, s.rows[item])
+        s.pending = list(items[keep:])
+        s.extend()
+    def extend(s):
+        if cmds.layout(s.layout, ex=True):
+            for item in s.pending[:ROW_CHUNK]:
+                s.rows[item] = s.build(s.layout, item)
+                s.items.append(item)
+            del s.pending[:ROW_CHUNK]
+            if s.pending and not s.scheduled:
+                s.scheduled = True
+                cmds.evalDeferred(s.resume, lp=True)
+    @report.Report()
+    def resume(s):
+        s.scheduled = False
+        s.extend()
+        if s.built:
+            s.built()
+    def remove(s, item):
+        if item in s.pending:
+            s.pending.remove(item)
+        if item in s.rows:
+            row = s.rows.pop(item)
+            s.items.remove(item)
+            if cmds.layout(row, ex=True):
+                cmds.deleteUI(row)
 
 class Animation(object):
     """
-    An animation entry
+    An animation entry. The scene is only asked for defaults that weren't given (new animations).
     """
+    __slots__ = ("data",)
     def __init__(s, override={}):
-        s.data = dict({
-            "name"  : "",
-            "range" : sorted(s.frameRange()),
-            "layers": s.animLayers()
-        }, **override)
+        s.data = dict(override)
+        if "name" not in s.data:
+            s.data["name"] = ""
+        if "range" not in s.data:
+            s.data["range"] = sorted(s.frameRange())
+        if "layers" not in s.data:
+            s.data["layers"] = s.animLayers()
     def frameRange(s):
         return [
             int(cmds.playbackOptions(q=True, min=True)),
@@ -226,6 +623,119 @@ class AnimationGUI(object):
             s.anim.data["layers"][attr].remove(layer)
         s.change()
 
+class TimingsGUI(object):
+    def __init__(s, run, clips, limit=10):
+        """
+        Show the slowest stages and animations of an export run
+        """
+        winName = "Export_Timings"
+        if cmds.window(winName, ex=True):
+            cmds.deleteUI(winName)
+        window = cmds.window(winName, t="Export Timings", rtf=True)
+        cmds.columnLayout(adj=True)
+        title("%s: %s animations, %s frames in %.2f seconds." % (
+            run["character"], run["clips"], run["frames"], run["total"]))
+        if run.get("error"):
+            cmds.text(l="Failed: %s" % textLimit(run["error"]), al="left", bgc=(1,0.4,0.4))
+        if run.get("problems"):
+            cmds.text(l="%s problems found checking files. Marked with !" % run["problems"], al="left", bgc=(1,0.7,0.3))
+        stages = dict(run["stages"])
+        for clip in clips: # Add up per animation stages
+            for stage, taken in clip["stages"].items():
+                if stage != "bake (shared)":
+                    stages[stage] = stages.get(stage, 0) + taken
+        title("Slowest Stages:")
+        for stage, taken in sorted(stages.items(), key=lambda x: -x[1]):
+            cmds.text(l="%8.2fs   %s" % (taken, stage), al="left")
+        title("Slowest Animations:")
+        cmds.scrollLayout(cr=True, bgc=(0.2,0.2,0.2), h=200)
+        for clip in sorted(clips, key=lambda x: -x["total"])[:limit]:
+            cmds.text(
+                l="%8.2fs   %s%s (%s frames, %.0f KB)" % (
+                    clip["total"], "! " if clip.get("problems") else "", textLimit(clip["anim"]), clip["frames"], clip["size"] / 1024.0),
+                ann="\n".join(["%s: %.2fs" % x for x in sorted(clip["stages"].items(), key=lambda x: -x[1])] +
+                    (["keys: %(before)s -> %(after)s" % clip["keys"]] if clip.get("keys") else []) + clip.get("problems", [])),
+                al="left")
+        cmds.showWindow(window)
+
+class ExportRunner(object):
+    """
+    Export in the background, one step each time Maya is idle.
+    Steps are as Exporter.steps gives them. Closing the steps cancels them.
+    Shows progress with an estimate of the time left, and can be cancelled between steps.
+    """
+    def __init__(s, name, steps, total, done=None, scene=True):
+        s.steps = steps
+        s.done = done # Called when finished, cancelled or failed
+        s.cancelled = False
+        s.started = time.time()
+        s.window = cmds.window(t="Exporting %s" % name, rtf=True)
+        cmds.columnLayout(adj=True)
+        s.label = cmds.text(l="Preparing %s animations..." % total, al="left", w=350)
+        s.bar = cmds.progressBar(max=max(total, 1))
+        cmds.button(l="Cancel", c=lambda x: s.cancel())
+        cmds.showWindow(s.window)
+        if scene: # Export belongs to the open scene
+            for event in ("PostSceneRead", "NewSceneOpened"):
+                cmds.scriptJob(e=[event, s.cancel], p=s.window)
+        cmds.evalDeferred(s.tick, lp=True)
+    def cancel(s):
+        s.cancelled = True
+    @report.Report()
+    def tick(s):
+        if s.cancelled or not cmds.window(s.window, ex=True): # Closing the window cancels too
+            s.steps.close()
+            print "Export cancelled."
+            return s.finish()
+        try:
+            done, total, clips = next(s.steps)
+        except StopIteration:
+            return s.finish()
+        except ExportError as e:
+            s.finish()
+            cmds.confirmDialog(t="Oh no..", m=str(e))
+            return
+        except Exception:
+            s.finish()
+            raise
+        taken = time.time() - s.started
+        cmds.progressBar(s.bar, e=True, max=total, pr=done)
+        if clips: # Steps can come with nothing new
+            cmds.text(s.label, e=True, l="Exported %s / %s: %s. About %s left." % (
+                done, total,
+                textLimit(", ".join(a.data["name"] for a in clips), 40),
+                datetime.timedelta(seconds=int(taken / max(done, 1) * (total - done)))
+                ))
+        cmds.evalDeferred(s.tick, lp=True)
+    def finish(s):
+        if cmds.window(s.window, ex=True):
+            cmds.deleteUI(s.window)
+        if s.done:
+            s.done()
+
+def workerSteps(workers, anims, interval=0.25):
+    """
+    Follow an export shared between processes (batch.Workers) as ExportRunner steps.
+    Processes are only looked at every interval (seconds). Steps in between return straight away.
+    Closing the steps stops the processes.
+    """
+    byName = dict((a.data["name"], a) for a in anims)
+    seen = set()
+    polled = 0
+    try:
+        while True:
+            if time.time() - polled < interval:
+                yield len(seen), workers.total, []
+                continue
+            polled = time.time()
+            if not workers.poll():
+                break
+            new = [n for n in workers.exported() if n not in seen]
+            seen.update(new)
+            yield len(seen), workers.total, [byName[n] for n in new if n in byName]
+    finally:
+        workers.cancel()
+
 class MainWindow(object):
     """
     Display animations
@@ -235,6 +745,11 @@ class MainWindow(object):
             # Build window
             name = "GameAnimExportWindow"
             s.animationData = []
+            s.displayAnim = {} # Store reference to GUI frames
+            s.animText = {} # Labels shown on animation rows
+            s.clipIndex = None # Lookup for highlighting, built when needed
+            s.highlighted = set()
+            s.runner = None # Export running in the background
             if cmds.window(name, ex=True):
                 cmds.deleteUI(name)
             s.window = cmds.window(name, t="Animations", rtf=True)
@@ -248,46 +763,59 @@ class MainWindow(object):
     @report.Report()
     def buildSelector(s):
         s.animationData = []
-        dataNameBase = "GameAnimExportData"
-        index = 1
-        characters = {}
-        while True:
-            dataName = dataNameBase + str(index)
-            index += 1
-            try:
-                data = loadInfo(dataName)
-                characters[dataName] = data["pref"]
-            except:
-                break
+        characters = characterIndex()
         s.clearElement(s.wrapper)
         cmds.setParent(s.wrapper)
         title("Select a character:")
         cmds.scrollLayout(cr=True, bgc=(0.2,0.2,0.2))
-        def addChar(char):
+        def addChar(key, pref, count):
+            cmds.rowLayout(nc=2, adj=1)
             cmds.iconTextButton(
                 st="iconAndTextHorizontal",
                 i="ghostOff.png",
-                l=characters[char],
-                ann="Open the character: %s." % characters[char],
+                l=pref,
+                ann="Open the character: %s. (%s animations)" % (pref, count),
                 h=50,
-                c=lambda: s.buildCharacter(char)
+                c=lambda: s.buildCharacter(key)
                 )
+            cmds.iconTextButton(
+                st="iconOnly",
+                i="removeRenderable.png",
+                ann="Remove the character: %s." % pref,
+                h=iconSize,
+                w=iconSize,
+                c=lambda: s.removeCharacter(key, pref)
+                )
+            cmds.setParent("..")
         if characters:
             for char in characters:
-                addChar(char)
+                addChar(*char)
         else:
             cmds.text(l="There are no characters set for this scene.\nTime to create one. :)")
         cmds.setParent("..")
         cmds.button(
             l="Create New Character",
             ann="Create a new character.",
-            c=lambda x: s.buildCharacter(dataName)
+            c=lambda x: s.buildCharacter(newCharacterKey(characters))
         )
 
+    @report.Report()
+    def removeCharacter(s, dataName, pref):
+        answer = cmds.confirmDialog(
+            t="Remove Character",
+            m="Remove the character \"%s\" and all of its animations?" % pref,
+            b=("Yes","No"), db="No", cb="No", ds="No")
+        if answer == "Yes":
+            removeInfo(dataName)
+            print "Removing Character:", pref
+            s.buildSelector()
+
     @report.Report()
     def buildCharacter(s, dataName):
         s.dataName = dataName
-        s.dirty = False
+        s.clipIndex = None
+        s.highlighted = set()
+        s.animText = {}
         s.data = loadInfo(s.dataName)
         # Initialize Data
         s.data["pref"] = s.data.get("pref", "Default")
@@ -295,6 +823,11 @@ class MainWindow(object):
         s.data["dirs"] = s.data.get("dirs", [])
         s.animationData = []
         s.data["anim"] = s.data.get("anim", {})
+        s.data["fbx"] = dict(FBX_FORMAT, **s.data.get("fbx", {}))
+        s.data["bake"] = s.data.get("bake", "none")
+        s.data["workers"] = s.data.get("workers", 1)
+        s.data["verify"] = s.data.get("verify", True)
+        s.data["reduce"] = dict(REDUCE, **s.data.get("reduce", {}))
         s.clearElement(s.wrapper)
         cmds.setParent(s.wrapper)
         cmds.button(
@@ -310,33 +843,113 @@ class MainWindow(object):
             ann="Choose a name that represents the character, to prefix all animation exports.",
             tcc=lambda x:s.changePrefix(prefix, x)
         )
+        cmds.rowLayout(nc=2)
+        fbxFormat = cmds.optionMenuGrp(
+            l="FBX Format: ",
+            ann="Binary files are smaller, and faster to write and to load.",
+            cc=lambda x: s.changeFormat("ascii", x == "ASCII")
+        )
+        for f in ("ASCII", "Binary"):
+            cmds.menuItem(l=f)
+        cmds.optionMenuGrp(fbxFormat, e=True, v="ASCII" if s.data["fbx"]["ascii"] else "Binary")
+        fbxVersion = cmds.optionMenuGrp(
+            l="Version: ",
+            ann="FBX file version to write. Default leaves it to the FBX plugin.",
+            cc=lambda x: s.changeFormat("version", "" if x == "Default" else x)
+        )
+        for v in ["Default"] + FBX_VERSIONS:
+            cmds.menuItem(l=v)
+        cmds.optionMenuGrp(fbxVersion, e=True, v=s.data["fbx"]["version"] or "Default")
+        cmds.setParent("..")
+        bake = cmds.optionMenuGrp(
+            l="Prebake: ",
+            ann="Bake animation before exporting. Simulation steps through every frame (needed for dynamics). "
+                "Fast and Parallel are quicker, for rigs without dynamics. Auto picks for you.",
+            cc=lambda x: s.changeBake(x.lower())
+        )
+        for b in BAKE_MODES:
+            cmds.menuItem(l=b.title())
+        cmds.optionMenuGrp(bake, e=True, v=s.data["bake"].title())
+        cmds.intFieldGrp(
+            l="Processes: ",
+            v1=s.data["workers"],
+            ann="Share Export All between this many mayapy processes, working from the saved scene. "
+                "Each one loads the scene, so this pays off with many or long animations.",
+            cc=lambda x: s.changeWorkers(x)
+        )
+        cmds.checkBoxGrp(
+            l="Verify: ",
+            l1="Check exported files",
+            v1=s.data["verify"],
+            ann="Scan each file once written, checking its frame range, skeleton and keys. Problems are printed and logged.",
+            cc=lambda x: s.changeVerify(x)
+        )
+        cmds.checkBoxGrp(
+            l="Reduce Keys: ",
+            l1="Thin out baked keys",
+            v1=s.data["reduce"]["enabled"],
+            ann="Remove baked keys that stay within tolerance, joining the rest with straight lines. "
+                "Smaller files, quicker to import. Needs a Prebake.",
+            cc=lambda x: s.changeReduce("enabled", bool(x))
+        )
+        tolerance = cmds.floatFieldGrp(
+            l="Tolerance: ",
+            nf=3,
+            pre=4,
+            v1=s.data["reduce"]["translate"],
+            v2=s.data["reduce"]["rotate"],
+            v3=s.data["reduce"]["scale"],
+            ann="Largest change allowed when removing keys. Translate (scene units), Rotate (degrees), Scale.",
+            cc=lambda *x: s.changeTolerance(tolerance)
+        )
         cmds.iconTextButton(
             st="iconAndTextHorizontal",
             i="fluidCacheCreate.png",
             l="Add a new Animation.",
             fn="boldLabelFont",
             ann="Create a new animation listing.",
-            c=lambda: s.addAnimation(animWrapper)
+            c=lambda: s.addAnimation()
             )
         animWrapper = cmds.scrollLayout(cr=True, bgc=(0.2,0.2,0.2))
         cmds.setParent("..")
+        cmds.rowLayout(nc=3, adj=1)
         cmds.button(
             l="Export All",
-            c=lambda x: [s.performExport(a) for a in s.animationData]
+            ann="Export all animations. Animations that haven't changed since their last export are skipped.",
+            c=lambda x: s.performExport(s.animationData)
+        )
+        cmds.button(
+            l="Force Export All",
+            ann="Export all animations, even ones that haven't changed.",
+            c=lambda x: s.performExport(s.animationData, force=True)
+        )
+        cmds.button(
+            l="Timings",
+            ann="Show where the time went in the last export.",
+            c=lambda x: s.showTimings()
         )
+        cmds.setParent("..")
+        unfinished = s.unfinishedExports()
+        if unfinished:
+            cmds.button(
+                l="Resume %s unfinished exports." % len(unfinished),
+                ann="Animations that didn't finish exporting last time (Maya closed, or something went wrong).",
+                bgc=(1,0.7,0.3),
+                c=lambda x: s.resumeExports(unfinished)
+            )
         cmds.iconTextButton(
             st="iconAndTextHorizontal",
             i="selectByObject.png",
             l="Add selected objects to export.",
             fn="boldLabelFont",
             ann="Select some objects (typically the rig) and press the button to add them.",
-            c=lambda: s.addExportSelection(selWrapper, cmds.ls(sl=True))
+            c=lambda: s.addExportSelection(cmds.ls(sl=True))
             )
         selWrapper = cmds.scrollLayout(cr=True, bgc=(0.2,0.2,0.2), h=80)
         cmds.setParent("..")
         cmds.button(
             l="Clear All",
-            c=lambda x: s.clearExportSelection(selWrapper)
+            c=lambda x: s.clearExportSelection()
         )
         cmds.iconTextButton(
             st="iconAndTextHorizontal",
@@ -344,21 +957,24 @@ class MainWindow(object):
             l="Add folder for exporting.",
             fn="boldLabelFont",
             ann="Pick some folders to export animations into. Folders that don't exist will be skipped.",
-            c=lambda: s.addExportFolder(dirWrapper)
+            c=lambda: s.addExportFolder()
             )
         dirWrapper = cmds.scrollLayout(cr=True, bgc=(0.2,0.2,0.2), h=80)
         cmds.setParent("..")
         cmds.button(
             l="Clear All",
-            c=lambda x: s.clearExportFolders(dirWrapper)
+            c=lambda x: s.clearExportFolders()
         )
         # Display Data data
-        if s.data["anim"]:
-            for anim in s.data["anim"]:
-                s.animationData.append(Animation(anim))
-        s.displayAnimations(animWrapper, s.animationData    )
-        s.displayExportSelection(selWrapper, s.data["objs"])
-        s.displayExportFolders(dirWrapper, s.data["dirs"])
+        s.animRows = RowList(animWrapper, s.addAnimRow, s.updateAnimRow, s.highlightAnimation)
+        s.selRows = RowList(selWrapper, s.addSelRow)
+        s.dirRows = RowList(dirWrapper, s.addDirRow)
+        s.clips = ClipCatalog(Animation(anim) for anim in s.data["anim"])
+        s.animationData = s.clips.anims
+        s.data["anim"] = s.clips.records
+        s.displayAnimations(s.animationData)
+        s.displayExportSelection(s.data["objs"])
+        s.displayExportFolders(s.data["dirs"])
         s.highlightAnimation()
     @report.Report()
     def save(s):
@@ -379,215 +995,213 @@ class MainWindow(object):
             s.save()
         else:
             cmds.control(element, e=True, bgc=(1,0.4,0.4))
-    def extractAnimationData(s, anims):
-        return sorted([a.data for a in anims], key=lambda x: x["range"][0])
+    def changeFormat(s, option, value):
+        s.data["fbx"][option] = value
+        s.save()
+    def changeBake(s, mode):
+        s.data["bake"] = mode
+        s.save()
+    def changeVerify(s, value):
+        s.data["verify"] = bool(value)
+        s.save()
+    def changeReduce(s, option, value):
+        s.data["reduce"][option] = value
+        s.save()
+    def changeTolerance(s, element):
+        for i, kind in enumerate(("translate", "rotate", "scale")):
+            s.data["reduce"][kind] = max(0.0, cmds.floatFieldGrp(element, q=True, **{"v%s" % (i + 1) : True}))
+        s.save()
+    def changeWorkers(s, count):
+        s.data["workers"] = max(1, count)
+        s.save()
     @report.Report()
     def setAnimation(s, anim):
-        cmds.playbackOptions(
-            e=True,
-            min=anim.data["range"][0],
-            max=anim.data["range"][1]
-        )
-        setLayers(
-            solo = anim.data["layers"]["solo"],
-            mute = anim.data["layers"]["mute"]
-        )
+        applyAnimation(anim.data)
     def validateAnimName(s, name): # Validate anim name
         if re.match(r"^[\w\s]{2,80}$", name):
-            if name.lower().replace(" ", "_") not in [a.data["name"].lower().replace(" ", "_") for a in s.animationData]:
+            if not s.clips.taken(name):
                 return True
         return False
     @report.Report()
-    def addAnimation(s, listElement):
-        def dataChanged():
-            s.data["anim"] = s.extractAnimationData(s.animationData)
-            s.save()
-            s.displayAnimations(listElement, s.animationData)
-        basename = "Anim_"
-        index = 1
-        animName = basename + str(index)
-        while animName in [a.data["name"] for a in s.animationData]:
-            index += 1
-            animName = basename + str(index)
+    def addAnimation(s):
         anim = Animation({
-            "name"  : animName
+            "name"  : s.clips.freeName()
             })
-        s.animationData.append(anim)
-        s.data["anim"] = s.extractAnimationData(s.animationData)
+        s.clips.add(anim)
         s.save()
-        AnimationGUI(anim, s.validateAnimName, dataChanged)
-        s.displayAnimations(listElement, s.animationData)
+        AnimationGUI(anim, s.validateAnimName, lambda: s.animationChanged(anim))
+        s.displayAnimations(s.animationData)
     @report.Report()
-    def removeAnimation(s, listElement, anim):
-        if cmds.layout(listElement, ex=True):
-            cmds.deleteUI(listElement)
-        if anim in s.animationData:
-            s.animationData.remove(anim)
-            s.data["anim"] = s.extractAnimationData(s.animationData)
+    def removeAnimation(s, anim):
+        s.animRows.remove(anim)
+        if anim in s.clips.entries:
+            s.clips.remove(anim)
             s.save()
+            s.clipIndex = None
         print "Removing Animation:", anim.data["name"]
     @report.Report()
-    def editAnimation(s, listElement, anim):
-        def dataChanged():
-            s.data["anim"] = s.extractAnimationData(s.animationData)
-            s.save()
-            s.displayAnimations(listElement, s.animationData)
-        AnimationGUI(anim, s.validateAnimName, dataChanged)
+    def editAnimation(s, anim):
+        AnimationGUI(anim, s.validateAnimName, lambda: s.animationChanged(anim))
+    def animationChanged(s, anim):
+        s.clips.update(anim)
+        s.save()
+        s.displayAnimations(s.animationData)
     @report.Report()
-    def displayAnimations(s, listElement, items):
-        if items:
-            s.clearElement(listElement)
-            s.displayAnim = {} # Store reference to GUI frames
-            def addAnim(item):
-                row = cmds.rowLayout(
-                    nc=6,
-                    adj=2,
-                    p=listElement)
-                cmds.iconTextStaticLabel(
-                    st="iconOnly",
-                    i="animCurveTA.svg",
-                    h=iconSize,
-                    w=iconSize
-                )
-                cmds.text(
-                    l="%s - %s : %s" % (
-                        item.data["range"][0],
-                        item.data["range"][1],
-                        textLimit(item.data["name"])
-                        ),
-                    al="left",
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="render.png",
-                    ann="Export Animation",
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: s.performExport(item)
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="traxFrameRange.png",
-                    ann="Go to frame range %s - %s and set animaton layers." % (
-                        item.data["range"][0],
-                        item.data["range"][1]
-                    ),
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: s.setAnimation(item)
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="setEdEditMode.png",
-                    ann="Edit Animation",
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: s.editAnimation(listElement, item)
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="removeRenderable.png",
-                    ann="Remove this animation.",
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: s.removeAnimation(row, item)
+    def displayAnimations(s, items):
+        s.clipIndex = None # Animations changed
+        s.animRows.show(sorted(items, key=lambda x: x.data["name"]))
+        s.displayAnim = s.animRows.rows
+        s.highlighted &= set(s.animRows.items) # New rows aren't highlighted yet
+        s.highlightAnimation()
+    def animLabels(s, item): # Text and frame range annotation for an animation row
+        return (
+            "%s - %s : %s" % (
+                item.data["range"][0],
+                item.data["range"][1],
+                textLimit(item.data["name"])
+                ),
+            "Go to frame range %s - %s and set animaton layers." % (
+                item.data["range"][0],
+                item.data["range"][1]
                 )
-                s.displayAnim[item] = row
-            for item in sorted(items, key=lambda x: x.data["name"]):
-                addAnim(item)
+            )
+    def addAnimRow(s, listElement, item):
+        label, rangeLabel = s.animLabels(item)
+        row = cmds.rowLayout(
+            nc=6,
+            adj=2,
+            p=listElement)
+        cmds.iconTextStaticLabel(
+            st="iconOnly",
+            i="animCurveTA.svg",
+            h=iconSize,
+            w=iconSize
+        )
+        text = cmds.text(
+            l=label,
+            al="left",
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="render.png",
+            ann="Export Animation",
+            h=iconSize,
+            w=iconSize,
+            c=lambda: s.performExport([item], force=True)
+        )
+        rangeButton = cmds.iconTextButton(
+            st="iconOnly",
+            i="traxFrameRange.png",
+            ann=rangeLabel,
+            h=iconSize,
+            w=iconSize,
+            c=lambda: s.setAnimation(item)
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="setEdEditMode.png",
+            ann="Edit Animation",
+            h=iconSize,
+            w=iconSize,
+            c=lambda: s.editAnimation(item)
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="removeRenderable.png",
+            ann="Remove this animation.",
+            h=iconSize,
+            w=iconSize,
+            c=lambda: s.removeAnimation(item)
+        )
+        s.animText[item] = ((label, rangeLabel), text, rangeButton)
+        return row
+    def updateAnimRow(s, item, row):
+        labels = s.animLabels(item)
+        shown, text, rangeButton = s.animText[item]
+        if labels != shown:
+            s.animText[item] = (labels, text, rangeButton)
+            cmds.text(text, e=True, l=labels[0])
+            cmds.iconTextButton(rangeButton, e=True, ann=labels[1])
     @report.Report()
     def highlightAnimation(s):
         if s.animationData:
-            frame = cmds.currentTime(q=True)
-            layers = getAllLayers()
-            mute = sorted([l for l in layers if layers[l]["mute"]])
-            solo = sorted([l for l in layers if layers[l]["solo"]])
-            if s.dirty:
-                for row in [s.displayAnim[r] for r in s.displayAnim]:
-                    if cmds.layout(row, ex=True):
-                        cmds.layout(row, e=True, bgc=[0.2,0.2,0.2])
-                        s.dirty = False
-            for anim in s.animationData:
-                l = anim.data["layers"]
-                r = anim.data["range"]
-                if sorted(l["mute"]) == mute and sorted(l["solo"]) == solo:
-                    if r[0] < frame < r[1]:
-                        row = s.displayAnim[anim]
-                        if cmds.layout(row, ex=True):
-                            cmds.layout(row, e=True, bgc=[0.25,0.25,0.25])
-                            s.dirty = True
+            if s.clipIndex is None:
+                s.clipIndex = ClipIndex(s.animationData)
+            active = s.clipIndex.find(LAYERS.state, cmds.currentTime(q=True))
+            for anim in s.highlighted ^ active: # Only touch rows that changed
+                row = s.displayAnim.get(anim)
+                if row and cmds.layout(row, ex=True):
+                    cmds.layout(row, e=True, bgc=[0.25,0.25,0.25] if anim in active else [0.2,0.2,0.2])
+            s.highlighted = set(a for a in active if a in s.displayAnim) # Rows still to be built get painted once they are
     @report.Report()
-    def addExportSelection(s, listElement, items):
+    def addExportSelection(s, items):
         if items:
             for item in items:
                 if item not in s.data["objs"]:
                     print "Adding object:", item
                     s.data["objs"].append(item)
             s.save()
-            s.displayExportSelection(listElement, s.data["objs"])
+            s.displayExportSelection(s.data["objs"])
         else:
             cmds.confirmDialog(t="Oh no!", m="You need to select something.")
     @report.Report()
-    def removeExportSelection(s, listElement, item):
-        if cmds.layout(listElement, ex=True):
-            cmds.deleteUI(listElement)
+    def removeExportSelection(s, item):
+        s.selRows.remove(item)
         if item in s.data["objs"]:
             s.data["objs"].remove(item)
             s.save()
         print "Removing Export Object:", item
-    def clearExportSelection(s, listElement):
+    def clearExportSelection(s):
         s.data["objs"] = []
         s.save()
         print "Cleared Export Selection"
-        s.displayExportSelection(listElement, [])
+        s.displayExportSelection([])
     @report.Report()
-    def displayExportSelection(s, listElement, items):
-        s.clearElement(listElement)
-        if items:
-            def addSel(item):
-                exists = cmds.objExists(item)
-                row = cmds.rowLayout(
-                    nc=4,
-                    adj=2,
-                    bgc=(0.2,0.2,0.2) if exists else (1,0.4,0.4),
-                    p=listElement)
-                if exists and cmds.objectType(item) == "joint":
-                    icon = "joint.svg"
-                elif exists:
-                    icon = "cube.png"
-                else:
-                    icon = "vacantCell.png"
-                cmds.iconTextStaticLabel(
-                    st="iconOnly",
-                    i=icon,
-                    h=iconSize,
-                    w=iconSize,
-                )
-                cmds.text(
-                    l=textLimit(item),
-                    al="left",
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="aselect.png",
-                    ann="Select the object in the scene.",
-                    en=exists,
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: cmds.select(item, r=True) if cmds.objExists(item) else None
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="removeRenderable.png",
-                    ann="Remove this object from the export selection.",
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: s.removeExportSelection(row, item)
-                )
-            for item in items:
-                addSel(item)
+    def displayExportSelection(s, items):
+        s.selRows.show(items)
+    def addSelRow(s, listElement, item):
+        exists = cmds.objExists(item)
+        row = cmds.rowLayout(
+            nc=4,
+            adj=2,
+            bgc=(0.2,0.2,0.2) if exists else (1,0.4,0.4),
+            p=listElement)
+        if exists and cmds.objectType(item) == "joint":
+            icon = "joint.svg"
+        elif exists:
+            icon = "cube.png"
+        else:
+            icon = "vacantCell.png"
+        cmds.iconTextStaticLabel(
+            st="iconOnly",
+            i=icon,
+            h=iconSize,
+            w=iconSize,
+        )
+        cmds.text(
+            l=textLimit(item),
+            al="left",
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="aselect.png",
+            ann="Select the object in the scene.",
+            en=exists,
+            h=iconSize,
+            w=iconSize,
+            c=lambda: cmds.select(item, r=True) if cmds.objExists(item) else None
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="removeRenderable.png",
+            ann="Remove this object from the export selection.",
+            h=iconSize,
+            w=iconSize,
+            c=lambda: s.removeExportSelection(item)
+        )
+        return row
     @report.Report()
-    def addExportFolder(s, listElement):
+    def addExportFolder(s):
         folder = cmds.fileDialog2(ds=2, cap="Select a Folder.", fm=3, okc="Select Folder")
         if folder:
             folder = relativePath(folder[0])
@@ -598,135 +1212,251 @@ class MainWindow(object):
                 print "Adding Export Folder:", folder
                 s.data["dirs"].append(folder)
                 s.save()
-                s.displayExportFolders(listElement, s.data["dirs"])
+                s.displayExportFolders(s.data["dirs"])
     @report.Report()
-    def removeExportFolder(s, listElement, path):
-        if cmds.layout(listElement, ex=True):
-            cmds.deleteUI(listElement)
+    def removeExportFolder(s, path):
+        s.dirRows.remove(path)
         if path in s.data["dirs"]:
             s.data["dirs"].remove(path)
             s.save()
         print "Removing Export Folder:", path
-    def clearExportFolders(s, listElement):
+    def clearExportFolders(s):
         s.data["dirs"] = []
         s.save()
         print "Cleared Export Folders"
-        s.displayExportFolders(listElement, [])
+        s.displayExportFolders([])
     @report.Report()
-    def displayExportFolders(s, listElement, items):
-        s.clearElement(listElement)
-        if items:
-            def addRow(item):
-                real = absolutePath(item)
-                exists = os.path.isdir(real)
-                if exists:
-                    icon = "navButtonBrowse.png"
-                else:
-                    icon = "vacantCell.png"
-                row = cmds.rowLayout(
-                    nc=4,
-                    adj=2,
-                    h=30,
-                    bgc=(0.2,0.2,0.2) if exists else (1,0.4,0.4),
-                    p=listElement)
-                cmds.iconTextStaticLabel(
-                    st="iconOnly",
-                    i=icon,
-                    h=iconSize,
-                    w=iconSize
-                )
-                cmds.text(
-                    l=textLimit(item),
-                    al="left",
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="traxOpenLibrary.png",
-                    ann="Open the folder.",
-                    en=exists,
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: webbrowser.open(real) if os.path.isdir(real) else None
-                )
-                cmds.iconTextButton(
-                    st="iconOnly",
-                    i="removeRenderable.png",
-                    ann="Remove this folder from the export list.",
-                    h=iconSize,
-                    w=iconSize,
-                    c=lambda: s.removeExportFolder(row, item)
-                )
-            for item in items:
-                addRow(item)
-    def performExport(s, anim, prebake=False):
-        # Validate scene data before export
-        if not s.data["pref"]:
-            return cmds.confirmDialog(t="Oh no..", m="Please add a prefix.")
-        pref = s.data["pref"]
-        if not s.data["objs"]:
-            return cmds.confirmDialog(t="Oh no..", m="Please add some objects to export.")
-        objs = [o for o in s.data["objs"] if cmds.objExists(o)]
-        if not objs:
-            return cmds.confirmDialog(t="Oh no..", m="None of the selected objects could be found.")
-        if not s.data["dirs"]:
-            return cmds.confirmDialog(t="Oh no..", m="Please add at least one folder to export into.")
-        dirs = [absolutePath(d) for d in s.data["dirs"]]
-        dirs = [d for d in dirs if os.path.isdir(d)]
-        if not dirs:
-            return cmds.confirmDialog(t="Oh no..", m="None of the chosen folders could be found.")
-        # Get our animation data
-        data = anim.data
-        if not data["name"] or not data["range"] or not data["layers"]:
-            return cmds.configDialog(t="Oh no..", m="There was an issue with you anim data.")
-        with cleanModify():
-            print "Exporting %s." % data["name"]
-            # Prep our animation
-            s.setAnimation(anim)
-
-            if prebake: # Bake out animation manually before export
-
-                cmds.bakeResults(
-                    objs,
-                    simulation=True,
-                    hierarchy="below",
-                    t=tuple(anim.data["range"]),
-                    sampleBy=1, # Mass keyframes, each frame!
-                    disableImplicitControl=True,
-                    # sparseAnimCurveBake=True,
-                    removeBakedAttributeFromLayer=True,
-                    # smart=(True, 5)
-                    minimizeRotation=True
-                )
-                # Wall off edges of time
-                cmds.setKeyframe(objs, i=True, t=anim.data["range"][0])
-                cmds.setKeyframe(objs, i=True, t=anim.data["range"][1])
-                # Remove Excess frames
-                times = cmds.keyframe(objs, q=True, tc=True)
-                frame_range = min(times), max(times)
-                if frame_range[0] < anim.data["range"][0]:
-                    cmds.cutKey(objs, t=(frame_range[0], anim.data["range"][0] - 0.1), cl=True)
-                if frame_range[1] > anim.data["range"][1]:
-                    cmds.cutKey(objs, t=(anim.data["range"][1] + 0.1, frame_range[1]), cl=True)
-
-
-            # Create filename
-            validate = r"[^\w_-]"
-            filename = "%s@%s" % (
-                re.sub(validate, "_", pref), # unicodedata.normalize("NFKD", pref)),
-                re.sub(validate, "_", data["name"]) # unicodedata.normalize("NFKD", data["name"]))
-                )
-            files = [os.path.realpath(os.path.join(d, filename)) for d in dirs]
-            # Prepare export command (yikes)
-            command =  """
-FBXResetExport; FBXExportInAscii -v true;
+    def displayExportFolders(s, items):
+        s.dirRows.show(items)
+    def addDirRow(s, listElement, item):
+        real = absolutePath(item)
+        exists = os.path.isdir(real)
+        if exists:
+            icon = "navButtonBrowse.png"
+        else:
+            icon = "vacantCell.png"
+        row = cmds.rowLayout(
+            nc=4,
+            adj=2,
+            h=30,
+            bgc=(0.2,0.2,0.2) if exists else (1,0.4,0.4),
+            p=listElement)
+        cmds.iconTextStaticLabel(
+            st="iconOnly",
+            i=icon,
+            h=iconSize,
+            w=iconSize
+        )
+        cmds.text(
+            l=textLimit(item),
+            al="left",
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="traxOpenLibrary.png",
+            ann="Open the folder.",
+            en=exists,
+            h=iconSize,
+            w=iconSize,
+            c=lambda: webbrowser.open(real) if os.path.isdir(real) else None
+        )
+        cmds.iconTextButton(
+            st="iconOnly",
+            i="removeRenderable.png",
+            ann="Remove this folder from the export list.",
+            h=iconSize,
+            w=iconSize,
+            c=lambda: s.removeExportFolder(item)
+        )
+        return row
+    @report.Report()
+    def performExport(s, anims, force=False):
+        try:
+            if s.runner:
+                raise ExportError("An export is already running.")
+            exporter = Exporter(s.data, jobs.openQueue(), s.dataName)
+            workers = min(s.data.get("workers", 1), len(anims))
+            if 1 < workers:
+                s.exportParallel(anims, workers, force)
+            else:
+                anims = list(anims)
+                s.runner = ExportRunner(exporter.pref, exporter.steps(anims, force=force), len(anims), s.exportDone)
+        except ExportError as e:
+            cmds.confirmDialog(t="Oh no..", m=str(e))
+    def exportDone(s):
+        s.runner = None
+    def unfinishedExports(s):
+        """ Jobs for this character, in this scene, left in the export queue """
+        scene = cmds.file(q=True, sn=True)
+        queue = jobs.openQueue() if scene else None
+        return queue.outstanding(scene, s.dataName) if queue else []
+    def resumeExports(s, unfinished):
+        names = set(j.anim for j in unfinished)
+        s.performExport([a for a in s.animationData if a.data["name"] in names], any(j.force for j in unfinished))
+    def exportParallel(s, anims, workers, force=False):
+        """ Share animations between mayapy processes, each exporting from the saved scene """
+        from . import batch
+        STORE.flush() # Anything unsaved makes the scene modified
+        scene = cmds.file(q=True, sn=True)
+        if not scene or cmds.file(q=True, modified=True):
+            raise ExportError("Please save the scene first. Export processes work from the saved file.")
+        processes = batch.Workers(scene, s.dataName, [a.data for a in anims], workers, force=force)
+        s.runner = ExportRunner( # Processes work from the file, so other scenes can be opened meanwhile
+            "%s (%s processes)" % (s.data["pref"], workers), workerSteps(processes, list(anims)), len(anims),
+            lambda: s.exportParallelDone(processes), scene=False)
+    def exportParallelDone(s, processes):
+        s.exportDone()
+        processes.close()
+        errors = [r for r in processes.results if r[3]]
+        for scene, char, anim, error in errors:
+            print "Error: %s: %s" % (char, error)
+        message = "Exported %s animations with %s processes." % (
+            len(processes.results) - len(errors), len(processes.outputs))
+        if errors:
+            message += "\n%s errors:\n%s" % (len(errors), "\n".join(textLimit(r[3]) for r in errors))
+        cmds.confirmDialog(t="Export", m=message)
+    @report.Report()
+    def showTimings(s):
+        report = readExportLog(s.data["pref"])
+        if report:
+            TimingsGUI(*report)
+        else:
+            cmds.confirmDialog(t="Nothing yet", m="There are no exports logged for %s yet." % s.data["pref"])
+
+if os.name == "nt":
+    import ctypes
+    def replaceFile(source, dest): # Atomic rename, replacing any existing file
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(source), unicode(dest), 0x1 | 0x8): # REPLACE_EXISTING | WRITE_THROUGH
+            raise ctypes.WinError()
+else:
+    replaceFile = os.rename
+
+def publish(source, dest):
+    """
+    Put a copy of source at dest, without anyone seeing a half written file.
+    Hard link if we can, copy if not.
+    """
+    temp = "%s.%s.tmp" % (dest, os.getpid())
+    try:
+        os.link(source, temp)
+    except (AttributeError, OSError): # No links on windows. Or different drive.
+        shutil.copyfile(source, temp)
+    try:
+        replaceFile(temp, dest)
+    finally:
+        if os.path.exists(temp): # Failed, or dest was already this same file
+            os.remove(temp)
+
+def publishExport(source, dest):
+    """ Publish an exported FBX (paths without extension), then its json stamp. Returns seconds taken """
+    start = time.time()
+    publish(source + ".fbx", dest + ".fbx")
+    publish(source + ".json", dest + ".json")
+    return time.time() - start
+
+class Timings(object):
+    """ Add up time spent in named stages """
+    def __init__(s):
+        s.stages = collections.OrderedDict()
+    @contextlib.contextmanager
+    def stage(s, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            s.add(name, time.time() - start)
+    def add(s, name, seconds):
+        s.stages[name] = s.stages.get(name, 0) + seconds
+
+EXPORT_LOG = "GAME_ANIM_EXPORT_LOG" # Environment variable. Log file to use instead of one beside the scene.
+
+def exportLogPath():
+    """ Export runs are logged (json lines) beside the scene, unless set elsewhere """
+    path = os.environ.get(EXPORT_LOG)
+    if not path:
+        scene = cmds.file(q=True, sn=True)
+        if scene:
+            path = os.path.splitext(scene)[0] + "_export.jsonl"
+        else:
+            path = os.path.join(cmds.workspace(q=True, rd=True), "untitled_export.jsonl")
+    return path
+
+def readExportLog(character, path=None):
+    """ Last logged export run for a character. Returns (run, clips) or None """
+    runs = collections.OrderedDict()
+    try:
+        with open(path or exportLogPath(), "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("character") == character:
+                    if entry.get("type") == "run":
+                        runs[entry["id"]] = (entry, runs.get(entry["id"], (None, []))[1])
+                    else:
+                        runs.setdefault(entry["id"], (None, []))[1].append(entry)
+    except IOError:
+        return None
+    runs = [r for r in runs.values() if r[0]]
+    return runs[-1] if runs else None
+
+BAKE_MODES = ["none", "auto", "simulation", "fast", "parallel"] # Prebake options. "auto" simulates when there are dynamics.
+DYNAMICS = ["nucleus", "hairSystem", "particle", "nParticle", "rigidBody", "rigidSolver", "expression"]
+
+class evaluationMode(object):
+    """ Switch the evaluation manager into a mode, if there is one (Maya 2016+) """
+    def __init__(s, mode):
+        s.mode = mode
+        s.previous = None
+    def __enter__(s):
+        if s.mode and hasattr(cmds, "evaluationManager"):
+            s.previous = cmds.evaluationManager(q=True, mode=True)[0]
+            if s.previous != s.mode:
+                cmds.evaluationManager(mode=s.mode)
+
+    def __exit__(s, *args):
+        if s.previous and s.previous != s.mode:
+            cmds.evaluationManager(mode=s.previous)
+
+BAKE_GAP = 10 # Clips with matching layers, closer than this (frames), share a bake
+
+def bakeGroups(anims):
+    """
+    Group clips by layer state, then into runs of nearby frame ranges.
+    Yields (frame range, clips) for each bake.
+    """
+    states = collections.OrderedDict()
+    for anim in anims:
+        states.setdefault(layerState(anim.data["layers"]), []).append(anim)
+    for group in states.values():
+        group = sorted(group, key=lambda x: x.data["range"][0])
+        frameRange, clips = list(group[0].data["range"]), []
+        for anim in group:
+            start, end = anim.data["range"]
+            if clips and frameRange[1] + BAKE_GAP < start:
+                yield frameRange, clips
+                frameRange, clips = [start, end], []
+            frameRange[1] = max(frameRange[1], end)
+            clips.append(anim)
+        yield frameRange, clips
+
+class ExportError(Exception):
+    """ Export can't go ahead. Message is for the user """
+
+FBX_FORMAT = {"ascii" : True, "version" : ""} # Default output format. Version "" = plugin default
+REDUCE = dict(simplify.TOLERANCES, enabled=False) # Key reduction of baked curves, and tolerances for each kind
+FBX_VERSIONS = ["FBX201800", "FBX201600", "FBX201400", "FBX201300", "FBX201200", "FBX201100"]
+
+# Prepare export command (yikes)
+FBX_OPTIONS = """
+FBXResetExport; FBXExportInAscii -v %(ascii)s;
 FBXExportCameras -v false; FBXExportLights -v false;
 FBXExportUpAxis %(axis)s; FBXExportUseSceneName -v false;
 FBXExportGenerateLog -v false; FBXExportConstraints -v false;
 FBXExportAxisConversionMethod addFbxRoot;
 FBXProperty "Export|IncludeGrp|Animation" -v true;
 FBXExportBakeComplexAnimation -v true;
-FBXExportBakeComplexStart -v %(start)s;
-FBXExportBakeComplexEnd -v %(end)s;
 FBXExportBakeComplexStep -v 1;
 FBXExportBakeResampleAnimation -v true;
 FBXExportApplyConstantKeyReducer -v true;
@@ -735,41 +1465,488 @@ FBXExportSkins -v true;
 FBXExportShapes -v true;
 FBXExportInputConnections -v false;
 FBXExportEmbeddedTextures -v false;
+"""
+
+class Exporter(object):
+    """
+    Export animations for a character.
+    Validates and resolves objects and folders once for any number of clips.
+    """
+    def __init__(s, data, queue=None, key=None):
+        # Validate scene data before export
+        if not data.get("pref"):
+            raise ExportError("Please add a prefix.")
+        s.pref = data["pref"]
+        if not data.get("objs"):
+            raise ExportError("Please add some objects to export.")
+        s.objs = [o for o in data["objs"] if cmds.objExists(o)]
+        if not s.objs:
+            raise ExportError("None of the selected objects could be found.")
+        if not data.get("dirs"):
+            raise ExportError("Please add at least one folder to export into.")
+        dirs = [absolutePath(d) for d in data["dirs"]]
+        s.dirs = [d for d in dirs if os.path.isdir(d)]
+        if not s.dirs:
+            raise ExportError("None of the chosen folders could be found.")
+        s.format = dict(FBX_FORMAT, **data.get("fbx", {}))
+        s.bakeMode = data.get("bake", "none")
+        s.bakeTimes = {} # Animation : seconds spent on its (shared) bake
+        s.timings = Timings() # Time spent on the run as a whole
+        s.clipStats = collections.OrderedDict() # Animation : timings, size, frames
+        s.report = None # (run, clips) as logged
+        s.fingerprints = {} # Animation : hash of its export inputs
+        s.verify = data.get("verify", True) # Check files once written
+        s.frameRate = verify.frameRate(cmds.currentUnit(q=True, t=True)) if s.verify else None
+        s.reduction = dict(REDUCE, **data.get("reduce", {})) # Key reduction, for baked exports
+        s.reducing = False
+        s.queue = queue # jobs.Queue to record progress in, for resuming
+        s.key = key or s.pref # Character, as named in the queue
+        s._curves = None
+        s._skeleton = None
+
+    def export(s, anims, bake=None, force=False):
+        """
+        Export animations in one go.
+        Bake is one of BAKE_MODES, or None to use the characters setting.
+        Animations unchanged since their last export are skipped, unless forced.
+        Returns the animations exported.
+        """
+        for step in s.steps(anims, bake, force):
+            pass
+        return s.exported
+
+    def steps(s, anims, bake=None, force=False):
+        """
+        Export animations a step at a time: one animation, or one bake shared by a few.
+        Yields (animations exported, animations to export, animations just exported) after each.
+        The scene is restored after every step, so they can be spread out. Close to cancel.
+        """
+        bake = bake or s.bakeMode
+        if bake == "auto": # Simulate only if something needs it
+            bake = "simulation" if cmds.ls(type=DYNAMICS) else "fast"
+        # Taken as they are now. Steps run while the window is still open to edits
+        anims = [Animation(copy.deepcopy(a.data)) for a in anims]
+        for anim in anims:
+            data = anim.data
+            if not data["name"] or not data["range"] or not data["layers"]:
+                raise ExportError("There was an issue with your anim data: %s" % data["name"])
+        started = time.time()
+        s.exported = []
+        s.failed = [] # (animation, error) that couldn't be copied out
+        options = FBX_OPTIONS % {
+            "axis"  : cmds.upAxis(q=True, ax=True),
+            "ascii" : "true" if s.format["ascii"] else "false"
+            }
+        if s.format["version"]:
+            options += "FBXExportFileVersion -v %s;\n" % s.format["version"]
+        settings = [options, bake, cmds.currentUnit(q=True, t=True), cmds.currentUnit(q=True, l=True)]
+        s.reducing = s.reduction["enabled"] and bake != "none"
+        if s.reduction["enabled"] and not s.reducing:
+            print "Key reduction needs a prebake. Exporting keys as they are."
+        if s.reducing: # Leave our keys be. The plugin would put a key back on every frame.
+            options += "FBXExportBakeComplexAnimation -v false;\n"
+            settings.append([s.reduction[k] for k in sorted(simplify.TOLERANCES)])
+        with s.timings.stage("fingerprint"):
+            s.fingerprints = dict((a, s.fingerprint(a.data, settings)) for a in anims)
+            if not force:
+                skip = set(a for a in anims if s.unchanged(a))
+                for anim in skip:
+                    print "Skipping unchanged animation: %s" % anim.data["name"]
+                anims = [a for a in anims if a not in skip]
+        STORE.flush() # Anything unsaved makes the scene modified
+        scene = cmds.file(q=True, sn=True)
+        # Only what's saved can be picked up again. Resuming exports from the file on disk
+        queue = s.queue if scene and not cmds.file(q=True, modified=True) else None
+        if queue and not force and skip: # Nothing to do for these
+            queue.mark(scene, s.key, [a.data["name"] for a in skip], jobs.DONE)
+        if not anims:
+            return
+        if queue:
+            queue.submit(scene, s.key, [(a.data["name"], s.fingerprints[a]) for a in anims], s.dirs, force)
+        with s.timings.stage("options"):
+            s.run(options)
+        if s.reducing: # Bake each clip on its own, so its curves hold only its frames
+            groups = [(list(anim.data["range"]), [anim]) for anim in anims]
+        elif bake != "none": # Bake once per layer state, export each clip out of it
+            groups = list(bakeGroups(anims))
+        else:
+            groups = [(None, [anim]) for anim in anims]
+        # FBX is written once into a temp folder, then copied out to the export folders
+        # in the background while the next animation exports.
+        s.temp = tempfile.mkdtemp(prefix="gameAnimExport")
+        s.pool = multiprocessing.pool.ThreadPool(min(len(s.dirs), 8))
+        s.copies = collections.OrderedDict() # Animation : copies, until published
+        error = None
+        try:
+            for frameRange, clips in groups:
+                state = exportState()
+                try:
+                    with state, suspendRefresh():
+                        cmds.select(s.objs, r=True)
+                        if frameRange:
+                            applyAnimation(clips[0].data)
+                            bakeLayers = s.bake(frameRange, bake, clips)
+                            try:
+                                for anim in clips:
+                                    s.exportAnimation(anim, baked=True, reduce=bakeLayers if s.reducing else None)
+                            finally:
+                                if bakeLayers:
+                                    cmds.delete(bakeLayers)
+                                LAYERS.invalidate()
+                        else:
+                            s.exportAnimation(clips[0])
+                finally:
+                    s.timings.add("restore", getattr(state, "taken", 0))
+                s.exported += clips
+                s.record(queue, scene, s.published())
+                yield len(s.exported), len(anims), clips
+            with s.timings.stage("publish"): # Waiting on copies still going
+                s.pool.close()
+                s.pool.join()
+                s.record(queue, scene, s.published())
+            if s.failed:
+                raise ExportError("Could not copy %s animations to the export folders:\n%s" % (
+                    len(s.failed), "\n".join("%s: %s" % (a.data["name"], e) for a, e in s.failed)))
+        except GeneratorExit:
+            error = "Cancelled"
+            if queue:
+                queue.mark(scene, s.key, [a.data["name"] for a in anims if a not in s.exported], jobs.CANCELLED)
+            raise
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            if queue:
+                queue.mark(scene, s.key, [a.data["name"] for a in anims if a not in s.exported], jobs.FAILED, error)
+            raise
+        finally:
+            s.pool.close()
+            s.pool.join() # Animations already exported still get copied out
+            s.record(queue, scene, s.published())
+            shutil.rmtree(s.temp, ignore_errors=True)
+            s.log(time.time() - started, error)
+
+    def published(s):
+        """
+        Animations that have finished copying out, since last asked. As (animation, error or None).
+        """
+        finished = []
+        for anim, copies in s.copies.items():
+            if all(c.ready() for c in copies):
+                del s.copies[anim]
+                error = None
+                for copy in copies:
+                    try:
+                        s.clipStats[anim]["stages"].add("publish", copy.get())
+                    except EnvironmentError as e:
+                        error = e
+                finished.append((anim, error))
+        return finished
+
+    def record(s, queue, scene, finished):
+        """ Mark published animations off in the queue. Failures are kept in s.failed """
+        s.failed += [(a, e) for a, e in finished if e]
+        if queue and finished:
+            queue.mark(scene, s.key, [a.data["name"] for a, e in finished if not e], jobs.DONE)
+            for anim, error in finished:
+                if error:
+                    queue.mark(scene, s.key, [anim.data["name"]], jobs.FAILED, str(error))
+
+    def log(s, total, error=None):
+        """ Append timings for this run to the export log. One json object per line """
+        runId = datetime.datetime.now().isoformat()
+        clips = []
+        for anim, stats in s.clipStats.items():
+            stages = stats["stages"]
+            if anim in s.bakeTimes:
+                stages.add("bake (shared)", s.bakeTimes[anim])
+            clips.append({
+                "type"      : "clip",
+                "id"        : runId,
+                "character" : s.pref,
+                "anim"      : anim.data["name"],
+                "range"     : anim.data["range"],
+                "frames"    : anim.data["range"][1] - anim.data["range"][0] + 1,
+                "size"      : stats["size"],
+                "keys"      : stats.get("keys"),
+                "problems"  : stats.get("problems", []),
+                "total"     : sum(stages.stages.values()),
+                "stages"    : stages.stages
+                })
+        run = {
+            "type"      : "run",
+            "id"        : runId,
+            "character" : s.pref,
+            "scene"     : cmds.file(q=True, sn=True),
+            "clips"     : len(clips),
+            "frames"    : sum(c["frames"] for c in clips),
+            "total"     : total,
+            "stages"    : s.timings.stages,
+            "problems"  : sum(len(c["problems"]) for c in clips),
+            "error"     : error
+            }
+        s.report = (run, clips)
+        path = exportLogPath()
+        try:
+            with open(path, "a") as f:
+                for entry in [run] + clips:
+                    f.write(json.dumps(entry) + "\n")
+        except IOError as e:
+            print "Could not write export log %s: %s" % (path, e)
+        if error:
+            print "Export stopped after %s animations (%s frames) in %.2f seconds. %s" % (
+                run["clips"], run["frames"], total, error)
+        else:
+            print "Exported %s animations (%s frames) in %.2f seconds." % (run["clips"], run["frames"], total)
+
+    def files(s, data): # Export paths for an animation (without extension)
+        # Create filename
+        validate = r"[^\w_-]"
+        filename = "%s@%s" % (
+            re.sub(validate, "_", s.pref), # unicodedata.normalize("NFKD", pref)),
+            re.sub(validate, "_", data["name"]) # unicodedata.normalize("NFKD", data["name"]))
+            )
+        return [os.path.realpath(os.path.join(d, filename)) for d in s.dirs]
+
+    def exportAnimation(s, anim, baked=False, reduce=None):
+        """
+        Write out one animation. Reduce is the layers it was baked onto, to thin out and write
+        as plain curves (see bypassLayers).
+        """
+        data = anim.data
+        print "Exporting %s." % data["name"]
+        stats = s.clipStats[anim] = {"stages" : Timings(), "size" : 0}
+        # Prep our animation
+        with stats["stages"].stage("layers"):
+            if baked: # Layers are already baked in
+                cmds.playbackOptions(e=True, min=data["range"][0], max=data["range"][1])
+            else:
+                applyAnimation(data)
+        if reduce:
+            with stats["stages"].stage("reduce"):
+                keys = stats["keys"] = s.reduceKeys(reduce, data["range"])
+            print "Reduced keys from %s to %s. Largest error: %s" % (keys["before"], keys["after"],
+                ", ".join("%s %.4g" % x for x in sorted(keys["error"].items())) or "none")
+
+        files = s.files(data)
+        command = """
+FBXExportBakeComplexStart -v %(start)s;
+FBXExportBakeComplexEnd -v %(end)s;
 """ % {
-    "axis"  : cmds.upAxis(q=True, ax=True),
     "start" : data["range"][0],
     "end"   : data["range"][1]
     }
-            for f in files:
-                command += "FBXExport -f \"%s.fbx\" -s;\n" % f.replace("\\", "/")
-            # Make our selection
-            cmds.select(objs, r=True)
-            # Run our mel command behemoth
-            print "Running Mel:"
-            for i, line in enumerate(command.split("\n")):
-                if line:
-                    print i, "\t", line
-            mel.eval(command)
-            # # Save out a convenience json file too
-            # for f in files:
-            #     with open(f + ".json", "w") as w:
-            #         w.write(json.dumps({
-            #             "start"     : data["range"][0],
-            #             "end"       : data["range"][1],
-            #             "modified"  : str(datetime.datetime.now())
-            #         }))
-
-
-
-class cleanModify(object):
-    """
-    Cleanly modify scene without permanent changes
+        temp = os.path.join(s.temp, os.path.basename(files[0]))
+        command += "FBXExport -f \"%s.fbx\" -s;\n" % temp.replace("\\", "/")
+        with stats["stages"].stage("write"), bypassLayers(reduce or []):
+            s.run(command)
+        stats["size"] = os.path.getsize(temp + ".fbx")
+        if s.verify:
+            with stats["stages"].stage("verify"):
+                stats["problems"] = verify.check(
+                    temp + ".fbx", data["range"], s.frameRate, s.skeleton(), reduced=bool(reduce))
+            for problem in stats["problems"]:
+                print "Warning: %s: %s" % (data["name"], problem)
+        # Save out a convenience json file too. Used to skip unchanged animations.
+        with open(temp + ".json", "w") as w:
+            w.write(json.dumps({
+                "start"      : data["range"][0],
+                "end"        : data["range"][1],
+                "modified"   : str(datetime.datetime.now()),
+                "fingerprint": s.fingerprints.get(anim)
+            }))
+        for f in files:
+            s.copies.setdefault(anim, []).append(s.pool.apply_async(publishExport, (temp, f)))
+
+    def unchanged(s, anim):
+        """ Do all exported files match the animation as it is now? """
+        for f in s.files(anim.data):
+            if not os.path.isfile(f + ".fbx"):
+                return False
+            try:
+                with open(f + ".json", "r") as r:
+                    if json.load(r).get("fingerprint") != s.fingerprints[anim]:
+                        return False
+            except (IOError, ValueError):
+                return False
+        return True
+
+    def fingerprint(s, data, settings):
+        """ Hash everything that goes into exporting this animation """
+        start, end = data["range"]
+        hasher = hashlib.sha1(json.dumps([
+            data["name"], data["range"], layerState(data["layers"]), s.objs, settings]))
+        for curve, timed, keys in s.curves():
+            if timed: # Keys in range, plus one either side as they shape the curve
+                lo = max(bisect.bisect_left(keys[0], start) - 1, 0)
+                hi = bisect.bisect_right(keys[0], end) + 1
+                keys = [k[lo:hi] for k in keys]
+            hasher.update(repr((curve, keys)))
+        return hasher.hexdigest()
+
+    def curves(s):
+        """
+        Keys (time, value, in / out tangents) on animation curves driving the export objects.
+        Queried once per Exporter.
+        """
+        if s._curves is None:
+            nodes = s.objs + (cmds.listRelatives(s.objs, ad=True, pa=True) or [])
+            history = cmds.ls(cmds.listHistory(nodes) or [], type="animCurve")
+            s._curves = []
+            for curve in sorted(set(history)):
+                s._curves.append((
+                    curve,
+                    cmds.nodeType(curve).startswith("animCurveT"), # Driven by time?
+                    [cmds.keyframe(curve, q=True, tc=True) or [],
+                    cmds.keyframe(curve, q=True, vc=True) or [],
+                    cmds.keyTangent(curve, q=True, ia=True) or [],
+                    cmds.keyTangent(curve, q=True, oa=True) or []]
+                ))
+        return s._curves
+
+    def skeleton(s):
+        """ Number of joints exported, for checking files. Queried once per Exporter """
+        if s._skeleton is None:
+            joints = cmds.ls(s.objs, type="joint") + (cmds.listRelatives(s.objs, ad=True, pa=True, type="joint") or [])
+            s._skeleton = len(set(joints))
+        return s._skeleton
+
+    def reduceKeys(s, layers, frameRange):
+        """
+        Remove keys from baked layers that straight lines can stand in for, within tolerance (see simplify).
+        Kept keys get linear tangents, so the curves still pass within tolerance of every frame.
+        Returns key counts before and after, and the largest error for each kind of curve.
+        """
+        frameRange = tuple(frameRange)
+        batches = collections.OrderedDict() # Key times : [(curve, kind, values)]. Baked curves share their times.
+        for layer in layers:
+            for curve in cmds.animLayer(layer, q=True, anc=True) or []:
+                kind = simplify.CURVE_KINDS.get(cmds.nodeType(curve))
+                if kind:
+                    times = tuple(cmds.keyframe(curve, q=True, t=frameRange, tc=True) or [])
+                    values = cmds.keyframe(curve, q=True, t=frameRange, vc=True) or []
+                    batches.setdefault(times, []).append((curve, kind, values))
+        result = {"before" : 0, "after" : 0, "error" : {}}
+        linear = []
+        for times, curves in batches.items():
+            reduced = simplify.reduceCurves(times, [(v, s.reduction[k]) for c, k, v in curves])
+            for (curve, kind, values), (kept, error) in zip(curves, reduced):
+                result["before"] += len(times)
+                result["after"] += len(kept)
+                result["error"][kind] = max([result["error"].get(kind, 0.0)] + error)
+                cut = [(times[a + 1], times[b - 1]) for a, b in zip(kept[:-1], kept[1:]) if a + 1 < b]
+                if cut:
+                    cmds.cutKey(curve, t=cut, cl=True)
+                    linear.append(curve)
+        if linear:
+            cmds.keyTangent(linear, t=frameRange, itt="linear", ott="linear")
+        return result
+
+    def bake(s, frameRange, mode, clips):
+        """
+        Bake into a new override layer, leaving the animation underneath untouched.
+        Mode is "simulation" (step through every frame, for dynamics), "fast" or "parallel".
+        Returns the new layers, to be deleted once done.
+        """
+        solo = LAYERS.state[0]
+        before = set(cmds.ls(type="animLayer"))
+        start = time.time()
+        with evaluationMode("parallel" if mode == "parallel" else None):
+            cmds.bakeResults(
+                s.objs,
+                simulation=mode == "simulation",
+                hierarchy="below",
+                t=tuple(frameRange),
+                sampleBy=1, # Mass keyframes, each frame!
+                disableImplicitControl=False, # Keep IK live. Undo is off, nothing would turn it back on
+                # sparseAnimCurveBake=True,
+                bakeOnOverrideLayer=True,
+                # smart=(True, 5)
+                minimizeRotation=True
+            )
+        taken = time.time() - start
+        s.timings.add("bake", taken)
+        for anim in clips:
+            s.bakeTimes[anim] = taken
+        print "Baked frames %s - %s (%s) in %.2f seconds, shared by: %s" % (
+            frameRange[0], frameRange[1], mode, taken, ", ".join(a.data["name"] for a in clips))
+        layers = list(set(cmds.ls(type="animLayer")) - before)
+        LAYERS.invalidate()
+        if solo: # Solo our layer too, or it won't be heard
+            for layer in layers:
+                cmds.animLayer(layer, e=True, s=True)
+        cmds.select(s.objs, r=True)
+        return layers
+
+    def run(s, command):
+        # Run our mel command behemoth
+        print "Running Mel:"
+        for i, line in enumerate(command.split("\n")):
+            if line:
+                print i, "\t", line
+        mel.eval(command)
+
+class bypassLayers(object):
+    """
+    Drive attributes baked onto layers straight from their curves there, skipping the layer blending.
+    With the plugin's baking off, only these plain curves are written out, not every layer.
+    Connections are put back directly, so the layers can be deleted as usual afterwards.
+    """
+    def __init__(s, layers):
+        s.layers = layers
+        s.removed = [] # (source, destination) taken off the attributes
+        s.added = [] # (curve, attribute) made in their place
+
+    def __enter__(s):
+        try:
+            for layer in s.layers:
+                for plug in cmds.animLayer(layer, q=True, at=True) or []:
+                    curve = cmds.animLayer(layer, q=True, fcv=plug)
+                    if not curve:
+                        continue
+                    node, attr = plug.split(".", 1)
+                    parents = cmds.attributeQuery(attr, n=node, lp=True) or [] # Rotations blend as one
+                    for target in [plug] + ["%s.%s" % (node, p) for p in parents]:
+                        for source in cmds.listConnections(target, s=True, d=False, p=True) or []:
+                            cmds.disconnectAttr(source, target)
+                            s.removed.append((source, target))
+                    cmds.connectAttr("%s.output" % curve[0], plug)
+                    s.added.append(("%s.output" % curve[0], plug))
+        except Exception:
+            s.__exit__()
+            raise
+
+    def __exit__(s, *args):
+        for source, target in s.added:
+            cmds.disconnectAttr(source, target)
+        for source, target in s.removed:
+            cmds.connectAttr(source, target)
+        s.removed, s.added = [], []
+
+class exportState(object):
+    """
+    Modify the scene for exporting, then put it back.
+    Undo is switched off, and what exporting changes is restored directly:
+    playback range, current frame, animation layers and selection.
     """
     def __enter__(s):
         s.selection = cmds.ls(sl=True)
-        cmds.undoInfo(ock=True)
+        s.playback = dict((k, cmds.playbackOptions(q=True, **{k : True})) for k in ("min", "max", "ast", "aet"))
+        s.time = cmds.currentTime(q=True)
+        layers = getAllLayers()
+        s.solo = [l for l in layers if layers[l]["solo"]]
+        s.mute = [l for l in layers if layers[l]["mute"]]
+        s.undo = cmds.undoInfo(q=True, st=True)
+        cmds.undoInfo(swf=False)
 
     def __exit__(s, *args):
-        cmds.select(s.selection, r=True)
-        cmds.undoInfo(cck=True)
-        cmds.undo()
+        start = time.time()
+        try:
+            setLayers(s.solo, s.mute)
+            cmds.playbackOptions(e=True, **s.playback)
+            cmds.currentTime(s.time)
+            if s.selection:
+                cmds.select(s.selection, r=True)
+            else:
+                cmds.select(cl=True)
+        finally:
+            cmds.undoInfo(swf=s.undo)
+            s.taken = time.time() - start
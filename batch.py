@@ -0,0 +1,297 @@
+# Command line exporting for the Game Animation Export Tool
+# Exports characters stored in scenes without any UI. Run with mayapy:
+#
+#   mayapy -m gameAnimExport.batch scene.ma [scene.ma ...] [options]
+#
+# Animations that haven't changed since they were last exported are skipped (see --force).
+# Exit code is 0 when everything exported, 1 if anything failed.
+
+import os
+import re
+import sys
+import json
+import heapq
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing.pool
+
+MODULE = "%s.batch" % (__package__ or __name__.rpartition(".")[0])
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Folder holding the package
+
+def parseArgs(args):
+    from . import BAKE_MODES
+    parser = argparse.ArgumentParser(
+        prog="mayapy -m %s" % MODULE,
+        description="Export game animations from scenes, without the UI.")
+    parser.add_argument("scenes", nargs="+", help="Maya scene files to export from.")
+    parser.add_argument("-c", "--character", action="append", default=[],
+        help="Character name (prefix) or key to export. Repeatable. Default: all.")
+    parser.add_argument("-a", "--anim", action="append", default=[],
+        help="Animation name to export. Repeatable. Default: all.")
+    parser.add_argument("-b", "--bake", choices=BAKE_MODES,
+        help="Bake animation before exporting, overriding each character's setting.")
+    parser.add_argument("-f", "--force", action="store_true",
+        help="Export animations even if they haven't changed since their last export.")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+        help="Export this many scenes at once, each in its own mayapy process.")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+        help="Share each character's animations between this many mayapy processes.")
+    parser.add_argument("--report", help=argparse.SUPPRESS) # Workers write their results here, as json
+    return parser.parse_args(args)
+
+def initialize():
+    """ Start up Maya and the FBX plugin """
+    import maya.standalone
+    maya.standalone.initialize()
+    import maya.cmds as cmds
+    cmds.loadPlugin("fbxmaya", qt=True)
+
+def openScene(path):
+    """ Open a scene, dropping anything cached from the last one. Returns an error message on failure """
+    import maya.cmds as cmds
+    from . import STORE, LAYERS
+    try:
+        cmds.file(path, o=True, f=True, prompt=False)
+    except RuntimeError as e:
+        return "Could not open scene: %s" % e
+    STORE.invalidate()
+    LAYERS.invalidate()
+
+def sceneClips(characters=None, anims=None):
+    """ Characters in the open scene as (key, data, animations) filtered by name """
+    from . import Animation, characterIndex, loadInfo
+    for key, pref, count in characterIndex():
+        if characters and key not in characters and pref not in characters:
+            continue
+        data = loadInfo(key)
+        clips = [Animation(a) for a in data.get("anim", [])]
+        if anims:
+            clips = [a for a in clips if a.data["name"] in anims]
+        if clips:
+            yield key, data, clips
+
+def unmatched(path, characters=None, anims=None, found=()):
+    """ Error results for character and animation names that matched nothing in the open scene """
+    from . import characterIndex
+    known = set(x for key, pref, count in characterIndex() for x in (key, pref))
+    names = set(a.data["name"] for key, data, clips in found for a in clips)
+    return ([(path, c, None, "No character named %s in the scene." % c) for c in characters or () if c not in known] +
+        [(path, None, a, "No animation named %s in the scene." % a) for a in anims or () if a not in names])
+
+def exportScene(path, characters=None, anims=None, bake=None, force=False, queue=None):
+    """
+    Open a scene and export its characters. Progress is recorded in the queue, if given.
+    Returns a list of (scene, character, animation, error) with error None on success.
+    Unchanged animations are skipped, and not listed, unless forced.
+    """
+    from . import Exporter, ExportError
+    error = openScene(path)
+    if error:
+        return [(path, None, None, error)]
+    found = list(sceneClips(characters, anims))
+    results = unmatched(path, characters, anims, found)
+    for key, data, clips in found:
+        try:
+            exported = Exporter(data, queue, key).export(clips, bake, force)
+        except (ExportError, RuntimeError) as e:
+            results.append((path, data["pref"], None, str(e)))
+        else:
+            results += [(path, data["pref"], a.data["name"], None) for a in exported]
+    return results
+
+def mayapy():
+    """ Python to run workers with. From the Maya GUI that's mayapy, beside maya itself """
+    location = os.environ.get("MAYA_LOCATION")
+    if location:
+        path = os.path.join(location, "bin", "mayapy.exe" if os.name == "nt" else "mayapy")
+        if os.path.isfile(path):
+            return path
+    return sys.executable
+
+def workerCommand(scene, characters=(), anims=(), bake=None, force=False, processes=1, report=None):
+    command = [mayapy(), "-m", MODULE, scene]
+    for char in characters:
+        command += ["-c", char]
+    for anim in anims:
+        command += ["-a", anim]
+    if bake:
+        command += ["-b", bake]
+    if force:
+        command.append("-f")
+    if 1 < processes:
+        command += ["-p", str(processes)]
+    if report:
+        command += ["--report", report]
+    return command
+
+def startProcess(command, output=subprocess.PIPE):
+    """ Start a worker, with this package importable, writing its output as it goes """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT, env.get("PYTHONPATH")) if p)
+    env["PYTHONUNBUFFERED"] = "1"
+    return subprocess.Popen(command, stdout=output, stderr=subprocess.STDOUT, env=env)
+
+def runProcess(command):
+    """ Run a worker to the end. Returns (exit code, output) """
+    process = startProcess(command)
+    output = process.communicate()[0]
+    return process.returncode, output
+
+def runWorker(scene, args):
+    """ Export one scene in a separate mayapy process """
+    code, output = runProcess(workerCommand(
+        scene, args.character, args.anim, args.bake, args.force, args.processes))
+    return scene, code, output
+
+def schedule(anims, workers):
+    """
+    Share animations (data) between workers. Longest first, each to the least loaded worker.
+    Returns a list of animations for each worker.
+    """
+    shares = [(0, i, []) for i in range(min(workers, len(anims)))]
+    for anim in sorted(anims, key=lambda x: x["range"][0] - x["range"][1]):
+        load, i, share = heapq.heappop(shares)
+        share.append(anim)
+        heapq.heappush(shares, (load + anim["range"][1] - anim["range"][0] + 1, i, share))
+    return [share for load, i, share in sorted(shares, key=lambda x: x[1])]
+
+class Workers(object):
+    """
+    mayapy processes sharing a character's animations (data) from a saved scene. Started straight away.
+    Each opens the scene and exports its share (see schedule). Poll to see how they are getting on.
+    """
+    def __init__(s, scene, character, anims, workers, bake=None, force=False):
+        s.scene = scene
+        s.character = character
+        s.total = len(anims)
+        s.temp = tempfile.mkdtemp(prefix="gameAnimExportWorkers")
+        s.running = [] # (process, share, report file, output file)
+        s.outputs = []
+        s.finished = [] # Animation names, from processes done with
+        s.results = []
+        for i, share in enumerate(schedule(anims, workers)):
+            report = os.path.join(s.temp, "%s.json" % i)
+            output = open(os.path.join(s.temp, "%s.log" % i), "w+")
+            process = startProcess(workerCommand(
+                scene, [character], [a["name"] for a in share], bake, force, report=report), output)
+            s.running.append((process, share, report, output))
+            s.outputs.append(output)
+
+    def poll(s):
+        """ Collect results from processes that have finished. Returns True while any are still going """
+        for worker in list(s.running):
+            process, share, report, output = worker
+            code = process.poll()
+            if code is not None:
+                s.running.remove(worker)
+                s.finished += [a["name"] for a in share]
+                s.results += s.collect(code, report, output)
+        return bool(s.running)
+
+    def exported(s):
+        """ Names of animations exported so far, going by the processes' output """
+        names = list(s.finished)
+        for process, share, report, output in s.running:
+            with open(output.name, "r") as f:
+                started = re.findall(r"^Exporting (.+)\.$", f.read(), re.M)
+            names += started[:-1] # The last is still being written
+        return names
+
+    def collect(s, code, report, output):
+        """ Results a process reported, as exportScene gives them """
+        try:
+            with open(report, "r") as f:
+                return [tuple(r) for r in json.load(f)]
+        except (IOError, ValueError):
+            output.seek(0)
+            return [(s.scene, s.character, None, "Worker failed (exit code %s):\n%s" % (code, output.read()[-2000:]))]
+
+    def cancel(s):
+        """
+        Stop any processes still going. What they have exported so far stays.
+        Their animations still waiting in the export queue are marked cancelled there.
+        """
+        from . import jobs
+        stopped = set()
+        for process, share, report, output in s.running:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            s.results.append((s.scene, s.character, None, "Cancelled"))
+            stopped.update(a["name"] for a in share)
+        s.running = []
+        queue = jobs.openQueue() if stopped else None
+        if queue:
+            pending = queue.jobs(s.scene, s.character, [jobs.PENDING])
+            queue.mark(s.scene, s.character, [j.anim for j in pending if j.anim in stopped], jobs.CANCELLED)
+
+    def wait(s):
+        """ Wait for every process to finish. Returns results as exportScene does """
+        for process, share, report, output in s.running:
+            process.wait()
+        s.poll()
+        return s.results
+
+    def close(s):
+        s.cancel()
+        for output in s.outputs:
+            output.close()
+        shutil.rmtree(s.temp, ignore_errors=True)
+
+def exportParallel(scene, character, anims, workers, bake=None, force=False):
+    """
+    Export animations (data) of one character from a saved scene, shared between mayapy processes.
+    Returns results as exportScene does.
+    """
+    workers = Workers(scene, character, anims, workers, bake, force)
+    try:
+        return workers.wait()
+    finally:
+        workers.close()
+
+def main(args=None):
+    args = parseArgs(sys.argv[1:] if args is None else args)
+    if 1 < args.workers and 1 < len(args.scenes): # Fan scenes out to worker processes
+        pool = multiprocessing.pool.ThreadPool(args.workers)
+        failed = []
+        for scene, code, output in pool.imap_unordered(lambda x: runWorker(x, args), args.scenes):
+            print "=" * 20, scene, "=" * 20
+            print output
+            if code:
+                failed.append(scene)
+        pool.close()
+        print "Exported %s scenes. %s failed." % (len(args.scenes) - len(failed), len(failed))
+        for scene in failed:
+            print "Failed:", scene
+        return 1 if failed else 0
+
+    from . import jobs
+    initialize()
+    queue = jobs.openQueue()
+    results = []
+    for scene in args.scenes:
+        if 1 < args.processes: # Share each character's animations out to worker processes
+            error = openScene(scene)
+            if error:
+                results.append((scene, None, None, error))
+                continue
+            found = list(sceneClips(args.character, args.anim))
+            results += unmatched(scene, args.character, args.anim, found)
+            for key, data, clips in found:
+                results += exportParallel(
+                    scene, key, [a.data for a in clips], args.processes, args.bake, args.force)
+        else:
+            results += exportScene(scene, args.character, args.anim, args.bake, args.force, queue)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f)
+    errors = [r for r in results if r[3]]
+    print "Exported %s animations. %s errors." % (len(results) - len(errors), len(errors))
+    for scene, char, anim, error in errors:
+        print "Error: %s %s: %s" % (scene, char or "", error)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
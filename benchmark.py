@@ -0,0 +1,584 @@
+# Benchmarks for the Game Animation Export Tool
+# Run inside Maya, for instance from the script editor:
+#
+#   import gameAnimExport.benchmark as bench
+#   bench.compareFormats("Hero", "Walk")
+
+import re
+import os
+import sys
+import json
+import time
+import types
+import math
+import random
+import shutil
+import argparse
+import datetime
+import tempfile
+import importlib
+import collections
+
+def findCharacter(character):
+    """ Load character data by its name (prefix) or key """
+    from . import characterIndex, loadInfo
+    for key, pref, count in characterIndex():
+        if character in (key, pref):
+            return loadInfo(key)
+    raise ValueError("Character not found: %s" % character)
+
+def compareFormats(character, anim, versions=("",), runs=3):
+    """
+    Export one animation as ASCII and as binary FBX into a temp folder.
+    Report the file size and best time spent writing the FBX file, for each.
+    Returns a list of (format, version, size in bytes, seconds).
+    """
+    from . import Animation, Exporter
+    data = findCharacter(character)
+    clips = [Animation(a) for a in data.get("anim", []) if a["name"] == anim]
+    if not clips:
+        raise ValueError("Animation not found: %s" % anim)
+    temp = tempfile.mkdtemp(prefix="gameAnimExportBench")
+    results = []
+    try:
+        for version in versions:
+            for ascii in (True, False):
+                test = dict(data, dirs=[temp], fbx={"ascii" : ascii, "version" : version})
+                exporter = Exporter(test)
+                best = None
+                for i in range(runs): # Only the FBX write, not the rest of the export around it
+                    exporter.export(clips, force=True)
+                    taken = exporter.clipStats.values()[0]["stages"].stages["write"] # Keyed by the run's own copy of the clip
+                    best = taken if best is None else min(best, taken)
+                size = os.path.getsize(exporter.files(clips[0].data)[0] + ".fbx")
+                results.append(("ASCII" if ascii else "Binary", version or "Default", size, best))
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+    print "%-8s %-10s %12s %10s" % ("Format", "Version", "Size (KB)", "Time (s)")
+    for form, version, size, taken in results:
+        print "%-8s %-10s %12.1f %10.3f" % (form, version, size / 1024.0, taken)
+    return results
+
+# Outside of Maya, the tools hot paths can be timed against a stand in for maya.cmds / maya.mel.
+# Run this file directly with python 2.7 (not with -m, as the package needs Maya to import):
+#
+#   python gameAnimExport/benchmark.py --characters 10 --clips 200 --layers 20 --latency 0.00005
+#
+# Each run is kept in a results file, and compared against the last run with the same settings.
+# Fake call counts don't depend on the machine, so any rise in them is a regression too.
+
+class FakeCmds(object):
+    """
+    Just enough of maya.cmds to drive the tool: nodes and attributes, animation layers,
+    playback, selection, fileInfo, scriptJobs, evalDeferred and UI controls.
+    Every command call costs "latency" seconds, and is counted.
+    """
+    COMMANDS = [
+        "getAttr", "setAttr", "addAttr", "deleteAttr", "listAttr", "attributeQuery", "objExists", "group", "ls", "select",
+        "delete", "about", "evalDeferred", "scriptJob", "fileInfo", "animLayer", "playbackOptions",
+        "currentTime", "currentUnit", "refresh", "undoInfo", "file", "workspace", "upAxis", "objectType", "nodeType",
+        "listRelatives", "listHistory", "keyframe", "keyTangent", "cutKey", "bakeResults",
+        "listConnections", "connectAttr", "disconnectAttr", "setParent",
+        "layout", "control", "deleteUI", "showWindow", "confirmDialog", "fileDialog2"]
+    LAYOUTS = ["window", "columnLayout", "rowLayout", "scrollLayout"]
+    CONTROLS = [
+        "text", "button", "separator", "iconTextButton", "iconTextStaticLabel", "iconTextCheckBox",
+        "textFieldGrp", "intFieldGrp", "floatFieldGrp", "optionMenuGrp", "menuItem", "progressBar", "checkBoxGrp"]
+
+    def __init__(s, latency=0):
+        s.latency = latency
+        s.calls = collections.Counter()
+        s.nodes = {} # Name : type
+        s.attrs = {} # "node.attr" : value
+        s.locked = set()
+        s.layers = collections.OrderedDict() # Name : parent. Root is BaseAnimation
+        s.children = {} # Node : child nodes
+        s.keys = {} # Curve : [times, values]
+        s.layerCurves = {} # Layer : curves (and blend nodes) on it
+        s.layerPlugs = {} # Layer : {attribute : curve}
+        s.connections = {} # Destination plug : source plug
+        s.info = collections.OrderedDict() # fileInfo
+        s.playback = {"min" : 1.0, "max" : 100.0, "ast" : 1.0, "aet" : 100.0}
+        s.time = 1.0
+        s.selection = []
+        s.sceneName = ""
+        s.modified = False
+        s.root = tempfile.gettempdir() # Workspace
+        s.batch = False
+        s.undoState = True
+        s.deferred = [] # Run when "idle"
+        s.jobs = {} # Id : (event or attribute, function, parent)
+        s.nextId = 0
+        s.ui = {} # Control : parent
+        s.parent = None
+
+    def module(s, name):
+        """ Wrap up the commands as a module """
+        mod = types.ModuleType(name)
+        for cmd in s.COMMANDS:
+            setattr(mod, cmd, s.command(cmd, getattr(s, cmd)))
+        for cmd in s.LAYOUTS + s.CONTROLS:
+            setattr(mod, cmd, s.command(cmd, s.widget(cmd)))
+        return mod
+    def command(s, name, func):
+        def call(*args, **kwargs):
+            s.calls[name] += 1
+            if s.latency:
+                end = time.time() + s.latency
+                while time.time() < end:
+                    pass
+            return func(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+    # Driving the fake scene
+    def idle(s):
+        """ Run everything waiting on Maya to be idle """
+        while s.deferred:
+            s.deferred.pop(0)()
+    def fire(s, trigger):
+        for job in sorted(s.jobs):
+            if job in s.jobs and s.jobs[job][0] == trigger:
+                s.deferred.append(s.jobs[job][1])
+    def create(s, name, kind, parent=None):
+        s.nodes[name] = kind
+        if parent:
+            s.children.setdefault(parent, []).append(name)
+        return name
+    def addLayer(s, name, parent="BaseAnimation", mute=False, solo=False):
+        if not s.layers:
+            s.layers["BaseAnimation"] = None
+            s.create("BaseAnimation", "animLayer")
+        s.layers[name] = parent
+        s.create(name, "animLayer")
+        s.attrs["%s.mute" % name] = mute
+        s.attrs["%s.solo" % name] = solo
+    def addCurve(s, node, attr, times, values):
+        curve = s.create("%s_%s" % (node, attr), "animCurveTA")
+        s.keys[curve] = [list(times), list(values)]
+        s.children.setdefault("history:" + node, []).append(curve)
+
+    # Scene
+    def getAttr(s, attr):
+        if attr not in s.attrs:
+            raise ValueError("No object matches name: %s" % attr)
+        return s.attrs[attr]
+    def setAttr(s, attr, *value, **kwargs):
+        if value:
+            if attr in s.locked:
+                raise RuntimeError("The attribute '%s' is locked." % attr)
+            s.attrs[attr] = value[0]
+            s.fire(attr)
+        if "l" in kwargs:
+            (s.locked.add if kwargs["l"] else s.locked.discard)(attr)
+    def addAttr(self, node, ln=None, **flags):
+        self.attrs["%s.%s" % (node, ln)] = None
+    def deleteAttr(s, attr):
+        del s.attrs[attr]
+    def listAttr(s, node, ud=False):
+        return [a.partition(".")[2] for a in s.attrs if a.partition(".")[0] == node] or None
+    def attributeQuery(s, attr, n=None, ex=False, lp=False):
+        if lp: # Rotations are compound, like Maya's
+            return ["rotate"] if attr in ("rotateX", "rotateY", "rotateZ") else None
+        return "%s.%s" % (n, attr) in s.attrs
+    def objExists(s, name):
+        return name in s.nodes or name in s.attrs
+    def group(s, n=None, em=True):
+        return s.create(n, "transform")
+    def ls(s, *args, **kwargs):
+        if kwargs.get("sl"):
+            return list(s.selection)
+        nodes = args[0] if args else s.nodes
+        kinds = kwargs.get("type")
+        if kinds:
+            kinds = [kinds] if isinstance(kinds, str) else kinds
+            nodes = [n for n in nodes if n in s.nodes and any(s.nodes[n].startswith(k) for k in kinds)]
+        return list(nodes)
+    def select(s, items=None, r=False, cl=False):
+        s.selection = [] if cl else list([items] if isinstance(items, str) else items)
+    def delete(s, nodes):
+        for node in [nodes] if isinstance(nodes, str) else nodes:
+            s.nodes.pop(node, None)
+            s.layers.pop(node, None)
+            for curve in s.layerCurves.pop(node, []):
+                s.nodes.pop(curve, None)
+                s.keys.pop(curve, None)
+            s.layerPlugs.pop(node, None)
+            for plug, source in list(s.connections.items()): # Blending goes with the layer
+                if source.partition(".")[0] not in s.nodes:
+                    del s.connections[plug]
+        orphans = [l for l, p in s.layers.items() if p and p not in s.layers] # Layers go with their parent
+        if orphans:
+            return s.delete(orphans)
+        s.fire("animLayerRebuild")
+    def about(s, b=False):
+        return s.batch
+    def evalDeferred(s, func, lp=False):
+        s.deferred.append(func)
+    def scriptJob(s, e=None, ac=None, p=None, ex=None, k=None, f=False):
+        if ex is not None:
+            return ex in s.jobs
+        if k is not None:
+            s.jobs.pop(k, None)
+            return
+        s.nextId += 1
+        trigger, func = e or ac
+        s.jobs[s.nextId] = (trigger, func, p)
+        return s.nextId
+    def fileInfo(s, *args, **kwargs):
+        if "rm" in kwargs:
+            s.info.pop(kwargs["rm"], None)
+        elif kwargs.get("q"):
+            if args:
+                return [s.info[args[0]]] if args[0] in s.info else []
+            return [x for k, v in s.info.items() for x in (k, v)]
+        else:
+            s.info[args[0]] = args[1]
+    def animLayer(self, layer=None, **flags): # "s" is a flag here (solo)
+        if flags.get("q"):
+            if flags.get("r"):
+                return "BaseAnimation" if self.layers else None
+            if flags.get("c"):
+                return [l for l, p in self.layers.items() if p == layer] or None
+            if flags.get("anc"):
+                return [c for c in self.layerCurves.get(layer, []) if self.nodes[c].startswith("animCurve")] or None
+            if flags.get("at"):
+                return list(self.layerPlugs.get(layer, {})) or None
+            if flags.get("fcv"):
+                curve = self.layerPlugs.get(layer, {}).get(flags["fcv"])
+                return [curve] if curve else None
+            return self.attrs["%s.%s" % (layer, "mute" if flags.get("m") else "solo")]
+        for flag, attr in (("s", "solo"), ("solo", "solo"), ("m", "mute"), ("mute", "mute")):
+            if flag in flags:
+                self.setAttr("%s.%s" % (layer, attr), bool(flags[flag]))
+    def playbackOptions(s, q=False, e=False, **kwargs):
+        if q:
+            return s.playback[kwargs.keys()[0]]
+        s.playback.update((k, float(v)) for k, v in kwargs.items())
+    def currentTime(s, frame=None, q=False):
+        if q:
+            return s.time
+        s.time = float(frame)
+        s.fire("timeChanged")
+    def currentUnit(s, q=False, t=False, l=False):
+        return "cm" if l else "film"
+    def refresh(s, su=None):
+        pass
+    def undoInfo(s, q=False, st=False, swf=None):
+        if q:
+            return s.undoState
+        s.undoState = swf
+    def file(s, *args, **kwargs):
+        if kwargs.get("modified"):
+            return s.modified
+        return s.sceneName
+    def workspace(s, q=False, rd=False):
+        return s.root
+    def upAxis(s, q=False, ax=False):
+        return "y"
+    def objectType(s, node):
+        return s.nodes[node]
+    nodeType = objectType
+    def listRelatives(s, nodes, ad=False, pa=False, type=None):
+        return [c for n in nodes for c in s.children.get(n, []) if not type or s.nodes[c] == type] or None
+    def listHistory(s, nodes):
+        return [c for n in nodes for c in s.children.get("history:" + n, [])] or None
+    def keyframe(s, curve, q=False, tc=False, vc=False, t=None):
+        keys = zip(*s.keys[curve])
+        if t:
+            keys = [k for k in keys if t[0] <= k[0] <= t[1]]
+        return [k[0 if tc else 1] for k in keys]
+    def keyTangent(s, curve, q=False, ia=False, oa=False, t=None, itt=None, ott=None):
+        if q:
+            return [0.0] * len(s.keys[curve][0])
+    def cutKey(s, curve, t=(), cl=False):
+        keys = [k for k in zip(*s.keys[curve]) if not any(a <= k[0] <= b for a, b in t)]
+        s.keys[curve] = [list(k) for k in zip(*keys)] if keys else [[], []]
+    def bakeResults(s, objs, t=(), **kwargs):
+        layer = "BakeResults%s" % len(s.layers)
+        s.addLayer(layer)
+        times = range(int(t[0]), int(t[1]) + 1)
+        for i, obj in enumerate(objs): # Smooth motion, a key every frame
+            for attr, kind in (("translateX", "animCurveTL"), ("rotateX", "animCurveTA"), ("scaleX", "animCurveTU")):
+                curve = s.create("%s_%s_%s" % (obj, attr, layer), kind)
+                s.keys[curve] = [list(times), [math.sin(f * 0.05 + i) * 10 for f in times]]
+                s.layerCurves.setdefault(layer, []).append(curve)
+                s.layerPlugs.setdefault(layer, {})["%s.%s" % (obj, attr)] = curve
+                blend = s.create("%s_blend" % curve, "animBlendNode") # Rotations blend as one
+                s.layerCurves[layer].append(blend)
+                s.connections["%s.%s" % (obj, "rotate" if attr.startswith("rotate") else attr)] = "%s.output" % blend
+    def listConnections(self, plug, **flags): # "s" is a flag here (sources)
+        return [self.connections[plug]] if plug in self.connections else None
+    def connectAttr(s, source, destination, f=False):
+        node, _, attr = destination.partition(".")
+        parent = "%s.rotate" % node if attr.startswith("rotate") else None
+        if not f and (destination in s.connections or parent in s.connections):
+            raise RuntimeError("'%s' already has an incoming connection" % destination)
+        s.connections[destination] = source
+    def disconnectAttr(s, source, destination):
+        if s.connections.get(destination) != source:
+            raise RuntimeError("'%s' is not connected to '%s'" % (source, destination))
+        del s.connections[destination]
+
+    # UI
+    def widget(s, kind):
+        layout = kind in s.LAYOUTS
+        def call(*args, **kwargs):
+            if args and (kwargs.get("q") or kwargs.get("e") or kwargs.get("ex")):
+                return args[0] in s.ui if kwargs.get("ex") else None
+            if kind == "window":
+                name = args[0] if args else "window%s" % len(s.ui)
+                if name in s.ui:
+                    raise RuntimeError("Window already exists: %s" % name)
+                parent = None
+            else:
+                name = "%s%s" % (kind, len(s.ui))
+                while name in s.ui:
+                    name += "_"
+                parent = kwargs.get("p", s.parent)
+            s.ui[name] = parent
+            if layout:
+                s.parent = name
+            return name
+        return call
+    def setParent(s, parent):
+        s.parent = s.ui.get(s.parent) if parent == ".." else parent
+    def layout(s, name, q=False, e=False, ex=False, ca=False, **kwargs):
+        if ex:
+            return name in s.ui
+        if ca:
+            return [c for c, p in s.ui.items() if p == name] or None
+    control = layout
+    def deleteUI(s, names):
+        names = [names] if isinstance(names, str) else names
+        for name in names:
+            if name not in s.ui:
+                raise RuntimeError("Object '%s' not found." % name)
+        gone = set(names)
+        while True: # Children go too
+            more = set(c for c, p in s.ui.items() if p in gone) - gone
+            if not more:
+                break
+            gone |= more
+        for name in gone:
+            del s.ui[name]
+        for job, (trigger, func, parent) in s.jobs.items():
+            if parent in gone:
+                del s.jobs[job]
+    def showWindow(s, window):
+        pass
+    def confirmDialog(s, **kwargs):
+        return "No"
+    def fileDialog2(s, **kwargs):
+        return None
+
+class FakeMel(object):
+    """ maya.mel, running the FBX export commands. Writes an ASCII FBX outline for the frames and selection. """
+    def __init__(s, cmds):
+        s.cmds = cmds
+        s.exports = []
+    def module(s, name):
+        mod = types.ModuleType(name)
+        mod.eval = s.cmds.command("mel.eval", s.eval)
+        return mod
+    def eval(s, command):
+        if "getApplicationVersionAsFloat" in command:
+            return 2016.0
+        path = re.search(r"FBXExport -f \"(.+?)\"", command)
+        if path:
+            start = float(re.search(r"FBXExportBakeComplexStart -v ([\d\.\-]+)", command).group(1))
+            end = float(re.search(r"FBXExportBakeComplexEnd -v ([\d\.\-]+)", command).group(1))
+            frames = int(end - start + 1)
+            ticks = 46186158000 // 24
+            keys = "\t\t\ta: %s\n" % ",".join(str(int(start + i) * ticks) for i in range(frames))
+            with open(path.group(1), "w") as f:
+                f.write("; FBX 7.4.0 project file\nFBXHeaderExtension:  {\n\tFBXVersion: 7400\n}\nObjects:  {\n")
+                for i, node in enumerate(s.cmds.selection):
+                    if s.cmds.nodes.get(node) == "joint":
+                        f.write("\tModel: %s, \"Model::%s\", \"LimbNode\" {\n\t}\n" % (i, node))
+                    f.write("\tAnimationCurve: %s, \"AnimCurve::\", \"\" {\n\t\tKeyTime: *%s {\n%s\t\t}\n\t}\n" % (
+                        i + 1000, frames, keys))
+                f.write("}\nTakes:  {\n\tTake: \"Take 001\" {\n\t\tLocalTime: %s,%s\n\t}\n}\n" % (
+                    int(start) * ticks, int(end) * ticks))
+            s.exports.append(path.group(1))
+
+def loadPackage(cmds, mel):
+    """ Import the package with the stand ins in place of Maya """
+    if "maya.cmds" in sys.modules:
+        raise RuntimeError("Maya is already loaded. The stand in is for use outside of Maya.")
+    maya = types.ModuleType("maya")
+    maya.cmds = sys.modules["maya.cmds"] = cmds.module("maya.cmds")
+    maya.mel = sys.modules["maya.mel"] = mel.module("maya.mel")
+    sys.modules["maya"] = maya
+    root = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(root))
+    return importlib.import_module(os.path.basename(root))
+
+def buildScene(cmds, game, characters=10, clips=200, layers=20, objects=50, keys=100, seed=1):
+    """
+    Fill the stand in with a synthetic scene. Characters share the objects and layers.
+    Returns the last frame used by any clip.
+    """
+    rand = random.Random(seed)
+    names = []
+    for i in range(layers):
+        name = "Layer%s" % i
+        cmds.addLayer(name, rand.choice(names) if names and rand.random() < 0.5 else "BaseAnimation")
+        names.append(name)
+    span = max(clips * 20, 200)
+    objs = []
+    for i in range(objects):
+        obj = cmds.create("joint%s" % i, "joint")
+        times = sorted(set(rand.randint(0, span) for k in range(keys)))
+        cmds.addCurve(obj, "rotateX", times, [rand.uniform(-180, 180) for t in times])
+        objs.append(obj)
+    os.mkdir(os.path.join(cmds.root, "export"))
+    for c in range(1, characters + 1):
+        anims = []
+        for a in range(clips):
+            start = rand.randint(0, span - 120)
+            anims.append({
+                "name"  : "Clip_%s" % a,
+                "range" : [start, start + rand.randint(10, 120)],
+                "layers": {
+                    "solo" : rand.sample(names, min(len(names), rand.randint(0, 1))),
+                    "mute" : rand.sample(names, min(len(names), rand.randint(0, 2)))
+                    }
+                })
+        game.STORE.set("%s%s" % (game.CHARACTER, c), {
+            "pref" : "Character%s" % c,
+            "objs" : list(objs),
+            "dirs" : ["export"],
+            "anim" : anims,
+            "fbx"  : dict(game.FBX_FORMAT),
+            "bake" : "none"
+            })
+    cmds.idle()
+    game.STORE.invalidate()
+    return span
+
+class Quiet(object):
+    """ Keep the tools printing out of the timings """
+    def write(s, text):
+        pass
+    def __enter__(s):
+        s.stdout, sys.stdout = sys.stdout, s
+    def __exit__(s, *args):
+        sys.stdout = s.stdout
+
+def measure(cmds, func, repeat=3):
+    """ Best time of a few runs, and the command calls made by one """
+    best = None
+    for i in range(repeat):
+        cmds.calls.clear()
+        with Quiet():
+            start = time.time()
+            func()
+            taken = time.time() - start
+        best = taken if best is None else min(best, taken)
+    return best, sum(cmds.calls.values())
+
+def suite(game, cmds, span, exports=20, repeat=3):
+    """ Time the hot paths. Returns {name : (seconds, calls)} """
+    with Quiet():
+        window = game.MainWindow()
+    key = game.characterIndex()[0][0]
+    def storeRead():
+        game.STORE.invalidate()
+        game.STORE.get(key)
+    def storeSave():
+        game.saveInfo(key, game.loadInfo(key))
+        cmds.idle()
+    def buildCharacter():
+        window.buildCharacter(key)
+        cmds.idle() # Finish building rows
+    def highlight():
+        for frame in range(0, span, max(1, span // 200)):
+            cmds.time = float(frame)
+            window.highlightAnimation()
+    def setLayers():
+        for anim in window.animationData[:100]:
+            game.setLayers(**anim.data["layers"])
+        cmds.idle()
+    def export():
+        window.performExport(window.animationData[:exports], force=True)
+        cmds.idle() # Export runs a step at a time, when idle
+    results = collections.OrderedDict()
+    results["Node.get"] = measure(cmds, storeRead, repeat)
+    results["Node.save"] = measure(cmds, storeSave, repeat)
+    results["buildSelector"] = measure(cmds, window.buildSelector, repeat)
+    results["buildCharacter"] = measure(cmds, buildCharacter, repeat)
+    results["highlightAnimation"] = measure(cmds, highlight, repeat)
+    results["setLayers"] = measure(cmds, setLayers, repeat)
+    results["performExport"] = measure(cmds, export, repeat)
+    return results
+
+RESULTS = os.path.join(os.path.expanduser("~"), ".gameAnimExport", "benchmark_results.json") # Outside the scripts folder
+SLOWER = 1.25 # Times slower than the last run, to count as a regression
+NOISE = 0.005 # Seconds. Differences smaller than this are timer noise
+
+def regressions(results, previous):
+    """ Compare results against a previous run. Yields messages """
+    for name, (taken, calls) in results.items():
+        if name in previous:
+            before, beforeCalls = previous[name]
+            if taken > before * SLOWER and taken - before > NOISE:
+                yield "%s is slower: %.4fs -> %.4fs" % (name, before, taken)
+            if calls > beforeCalls:
+                yield "%s makes more calls: %s -> %s" % (name, beforeCalls, calls)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Time the Game Animation Export Tool against a stand in for Maya.")
+    parser.add_argument("--characters", type=int, default=10)
+    parser.add_argument("--clips", type=int, default=200, help="Animations per character.")
+    parser.add_argument("--layers", type=int, default=20)
+    parser.add_argument("--objects", type=int, default=50)
+    parser.add_argument("--keys", type=int, default=100, help="Keys per object.")
+    parser.add_argument("--exports", type=int, default=20, help="Animations to export.")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds each Maya command takes.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--results", default=RESULTS, help="File to keep results in.")
+    parser.add_argument("--no-save", action="store_true", help="Compare only, don't keep this run.")
+    args = parser.parse_args(sys.argv[1:] if args is None else args)
+    settings = dict((k, v) for k, v in vars(args).items() if k not in ("results", "no_save", "repeat"))
+
+    cmds = FakeCmds(args.latency)
+    mel = FakeMel(cmds)
+    game = loadPackage(cmds, mel)
+    cmds.root = tempfile.mkdtemp(prefix="gameAnimExportBench")
+    os.environ[game.EXPORT_LOG] = os.path.join(cmds.root, "export.jsonl")
+    os.environ[game.jobs.QUEUE] = os.path.join(cmds.root, "jobs.db")
+    try:
+        span = buildScene(cmds, game, args.characters, args.clips, args.layers, args.objects, args.keys)
+        results = suite(game, cmds, span, args.exports, args.repeat)
+    finally:
+        shutil.rmtree(cmds.root, ignore_errors=True)
+
+    try:
+        with open(args.results, "r") as f:
+            history = json.load(f)
+    except (IOError, ValueError):
+        history = []
+    previous = [h["results"] for h in history if h["settings"] == settings]
+    print "%-20s %12s %10s" % ("Benchmark", "Time (s)", "Calls")
+    for name, (taken, calls) in results.items():
+        print "%-20s %12.4f %10s" % (name, taken, calls)
+    problems = list(regressions(results, previous[-1])) if previous else []
+    for problem in problems:
+        print "REGRESSION:", problem
+    if not args.no_save:
+        history.append({
+            "time"     : str(datetime.datetime.now()),
+            "settings" : settings,
+            "results"  : results
+            })
+        folder = os.path.dirname(os.path.abspath(args.results))
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(args.results, "w") as f:
+            json.dump(history, f, indent=1)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# Export job queue for the Game Animation Export Tool
+# Every animation handed to the exporter from a saved scene is recorded as a job,
+# and marked off once its files are published. The queue is shared by the UI and the
+# batch exporter, across scenes. If Maya goes down part way, finish off with mayapy:
+#
+#   mayapy -m gameAnimExport.jobs                 # List unfinished exports
+#   mayapy -m gameAnimExport.jobs resume          # Export them, one scene after another
+#   mayapy -m gameAnimExport.jobs clear           # Forget finished jobs (--all for everything)
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import collections
+
+QUEUE = "GAME_ANIM_EXPORT_QUEUE" # Environment variable. Queue file to use instead of the default
+DEFAULT = os.path.join(os.path.expanduser("~"), ".gameAnimExport", "jobs.db")
+
+PENDING = "pending" # Submitted, not yet published
+DONE = "done"
+FAILED = "failed" # Tried again on resume
+CANCELLED = "cancelled" # Stopped by the user. Not resumed
+MISSING = "missing" # Animation (or scene) no longer there. Not resumed
+OUTSTANDING = (PENDING, FAILED)
+
+Job = collections.namedtuple("Job", "scene character anim dirs fingerprint force status error submitted finished")
+
+class Queue(object):
+    """
+    Export jobs in an sqlite database. One job per animation in a scene.
+    Submitting an animation again replaces its old job.
+    """
+    def __init__(s, path=None):
+        s.path = path or os.environ.get(QUEUE) or DEFAULT
+        folder = os.path.dirname(s.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        s.db = sqlite3.connect(s.path, timeout=30) # Other exports may be writing
+        with s.db:
+            s.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                scene TEXT, character TEXT, anim TEXT, dirs TEXT, fingerprint TEXT, force INTEGER,
+                status TEXT, error TEXT, submitted REAL, finished REAL,
+                PRIMARY KEY (scene, character, anim))""")
+    def submit(s, scene, character, anims, dirs, force=False):
+        """ Record animations, given as (name, fingerprint), as waiting to export """
+        now = time.time()
+        with s.db:
+            s.db.executemany("INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?,?,?,?,?,?)", [
+                (scene, character, name, json.dumps(dirs), fingerprint, int(force), PENDING, None, now, None)
+                for name, fingerprint in anims])
+    def mark(s, scene, character, names, status, error=None):
+        now = time.time()
+        with s.db:
+            s.db.executemany(
+                "UPDATE jobs SET status=?, error=?, finished=? WHERE scene=? AND character=? AND anim=?",
+                [(status, error, now, scene, character, name) for name in names])
+    def jobs(s, scene=None, character=None, status=None):
+        query, args = "SELECT * FROM jobs WHERE 1", []
+        for column, value in (("scene", scene), ("character", character)):
+            if value is not None:
+                query += " AND %s=?" % column
+                args.append(value)
+        if status:
+            query += " AND status IN (%s)" % ",".join("?" * len(status))
+            args += status
+        rows = s.db.execute(query + " ORDER BY submitted, scene, character, anim", args)
+        return [Job(*r[:3] + (json.loads(r[3]),) + r[4:]) for r in rows]
+    def outstanding(s, scene=None, character=None):
+        """ Jobs still to finish """
+        return s.jobs(scene, character, OUTSTANDING)
+    def clear(s, everything=False):
+        with s.db:
+            if everything:
+                s.db.execute("DELETE FROM jobs")
+            else:
+                s.db.execute("DELETE FROM jobs WHERE status=?", (DONE,))
+
+def openQueue(path=None):
+    """ The queue, or None if it can't be opened. Exporting goes on either way """
+    try:
+        return Queue(path)
+    except (sqlite3.Error, EnvironmentError) as e:
+        print "Could not open the export queue: %s" % e
+
+def resume(queue, scenes=None):
+    """
+    Export everything outstanding, opening each scene once.
+    Returns a list of (scene, character, animation, error) as the batch exporter does.
+    """
+    from . import batch, Exporter, ExportError
+    work = collections.OrderedDict() # Scene : (character, force) : names
+    for job in queue.outstanding():
+        if not scenes or job.scene in scenes:
+            work.setdefault(job.scene, collections.OrderedDict()).setdefault(
+                (job.character, bool(job.force)), []).append(job.anim)
+    if not work:
+        return []
+    batch.initialize()
+    results = []
+    for scene, groups in work.items():
+        error = batch.openScene(scene)
+        if error:
+            results.append((scene, None, None, error))
+            for (character, force), names in groups.items():
+                queue.mark(scene, character, names, FAILED, error)
+            continue
+        for (character, force), names in groups.items():
+            found = set()
+            for key, data, clips in batch.sceneClips([character], names):
+                found |= set(a.data["name"] for a in clips)
+                try:
+                    exported = Exporter(data, queue, key).export(clips, force=force)
+                except (ExportError, RuntimeError) as e:
+                    results.append((scene, data["pref"], None, str(e)))
+                else:
+                    results += [(scene, data["pref"], a.data["name"], None) for a in exported]
+            missing = [n for n in names if n not in found]
+            if missing:
+                queue.mark(scene, character, missing, MISSING, "Animation is no longer in the scene.")
+    return results
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="mayapy -m %s" % (__package__ or __name__.rpartition(".")[0]) + ".jobs",
+        description="List, resume or clear unfinished game animation exports.")
+    parser.add_argument("command", nargs="?", default="list", choices=["list", "resume", "clear"])
+    parser.add_argument("-s", "--scene", action="append", default=[],
+        help="Only resume jobs from this scene. Repeatable.")
+    parser.add_argument("--all", action="store_true", help="Clear every job, not just finished ones.")
+    parser.add_argument("--queue", help="Queue file. Default: $%s or %s" % (QUEUE, DEFAULT))
+    args = parser.parse_args(sys.argv[1:] if args is None else args)
+    queue = Queue(args.queue)
+    if args.command == "clear":
+        queue.clear(args.all)
+        return 0
+    if args.command == "list":
+        outstanding = queue.outstanding()
+        for job in outstanding:
+            print "%-8s %s  %s  %s%s" % (job.status, job.scene, job.character, job.anim,
+                "  (%s)" % job.error if job.error else "")
+        print "%s unfinished exports." % len(outstanding)
+        return 0
+    results = resume(queue, args.scene)
+    errors = [r for r in results if r[3]]
+    print "Exported %s animations. %s errors." % (len(results) - len(errors), len(errors))
+    for scene, char, anim, error in errors:
+        print "Error: %s %s: %s" % (scene, char or "", error)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# Key reduction for the Game Animation Export Tool
+# Thins out baked, key-per-frame curves, keeping only the keys needed to stay within a tolerance
+# of the original values. Kept keys are joined with straight lines, so the error is exact at every
+# frame. Uses NumPy when it can be imported (much faster on long curves), plain python otherwise.
+#
+#   import gameAnimExport.simplify as simplify
+#   keep, error = simplify.reduceCurve(times, values, 0.1, fixed=[0, 29])
+#   [(keep, error), ...] = simplify.reduceCurves(times, [(values, 0.1), ...])
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TOLERANCES = {"translate" : 0.01, "rotate" : 0.1, "scale" : 0.001} # Default allowed error. Scene units / degrees
+CURVE_KINDS = {"animCurveTL" : "translate", "animCurveTA" : "rotate", "animCurveTU" : "scale"} # Curve node types reduced
+
+def reduceCurve(times, values, tolerance, fixed=()):
+    """
+    Pick keys to keep, so straight lines between them stay within tolerance of every value.
+    Times must be increasing. First, last and any "fixed" (indices) keys are always kept.
+    Returns (indices kept, in order, error at each key once reduced).
+    """
+    if len(times) < 3:
+        return list(range(len(times))), [0.0] * len(times)
+    if numpy is not None:
+        kept, error = reduceArrays(times, values, tolerance, fixed)
+        return kept.tolist(), error
+    return reduceLists(times, values, tolerance, fixed)
+
+def reduceCurves(times, curves, fixed=()):
+    """
+    reduceCurve for many curves keyed at the same times, as (values, tolerance).
+    With NumPy the curves are laid end to end and reduced together, in one go.
+    Returns (indices kept, errors) for each curve.
+    """
+    if numpy is None or len(times) < 3:
+        return [reduceCurve(times, values, tolerance, fixed) for values, tolerance in curves]
+    count = len(times)
+    times = numpy.asarray(times, dtype=float)
+    step = times[-1] - times[0] + 1 # Gap between curves, keeping times increasing
+    offsets = numpy.arange(len(curves)) * count
+    kept, error = reduceArrays(
+        numpy.concatenate([times + i * step for i in range(len(curves))]),
+        numpy.concatenate([numpy.asarray(v, dtype=float) for v, t in curves]),
+        numpy.repeat([t for v, t in curves], count),
+        numpy.concatenate([offsets + f for f in sorted(set(fixed) | set([0, count - 1]))]))
+    kept = numpy.asarray(kept)
+    bounds = numpy.searchsorted(kept, numpy.append(offsets, len(curves) * count))
+    return [((kept[bounds[i]:bounds[i + 1]] - offsets[i]).tolist(), error[offsets[i]:offsets[i] + count])
+        for i in range(len(curves))]
+
+def reduceArrays(times, values, tolerance, fixed=()):
+    """
+    reduceCurve with NumPy, returning kept indices as an array. Tolerance can be one per key.
+    Every segment over tolerance is split at its worst key in one pass, repeating until none are over.
+    Only keys in segments split last pass are looked at again. The same keys as reduceLists.
+    """
+    times = numpy.asarray(times, dtype=float)
+    values = numpy.asarray(values, dtype=float)
+    count = len(times)
+    tolerance = numpy.zeros(count) + tolerance
+    keep = numpy.zeros(count, dtype=bool)
+    keep[[0, count - 1]] = True
+    keep[list(fixed)] = True
+    error = numpy.zeros(count)
+    active = numpy.arange(count) # Keys whose segment might still be over tolerance
+    while len(active):
+        kept = numpy.flatnonzero(keep)
+        segment = numpy.minimum(numpy.searchsorted(kept, active, side="right") - 1, len(kept) - 2)
+        start, end = kept[segment], kept[segment + 1]
+        blend = (times[active] - times[start]) / (times[end] - times[start])
+        local = numpy.abs(values[active] - (values[start] + (values[end] - values[start]) * blend))
+        error[active] = local
+        over = numpy.flatnonzero(local > tolerance[active])
+        if not len(over):
+            break
+        # Worst (then earliest) key of each segment over tolerance. Keys are in order, so segments are runs
+        overSegment, overError = segment[over], local[over]
+        runs = numpy.flatnonzero(numpy.concatenate(([True], overSegment[1:] != overSegment[:-1])))
+        worst = numpy.repeat(numpy.maximum.reduceat(overError, runs), numpy.diff(numpy.append(runs, len(over))))
+        hits = numpy.flatnonzero(overError == worst)
+        run = numpy.searchsorted(runs, hits, side="right") - 1
+        split = active[over[hits[numpy.concatenate(([True], run[1:] != run[:-1]))]]]
+        keep[split] = True
+        error[split] = 0.0
+        changed = numpy.zeros(len(kept) - 1, dtype=bool)
+        changed[overSegment[runs]] = True
+        active = active[changed[segment] & ~keep[active]]
+    return numpy.flatnonzero(keep), error.tolist()
+
+def reduceLists(times, values, tolerance, fixed=()):
+    """ reduceCurve in plain python. Splits segments at their worst key until all are within tolerance """
+    count = len(times)
+    kept = sorted(set([0, count - 1]) | set(fixed))
+    error = [0.0] * count
+    spans = list(zip(kept[:-1], kept[1:]))
+    while spans:
+        start, end = spans.pop()
+        worst, worstError = None, tolerance
+        for i in range(start + 1, end):
+            blend = (times[i] - times[start]) / float(times[end] - times[start])
+            error[i] = abs(values[i] - (values[start] + (values[end] - values[start]) * blend))
+            if error[i] > worstError:
+                worst, worstError = i, error[i]
+        if worst is not None:
+            kept.append(worst)
+            error[worst] = 0.0
+            spans += [(start, worst), (worst, end)]
+    return sorted(kept), error
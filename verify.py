@@ -0,0 +1,148 @@
+# Check exported FBX files for the Game Animation Export Tool
+# Files are memory mapped and scanned, never loaded whole. ASCII files are searched with
+# regular expressions, binary files are walked node record by node record, skipping
+# everything but models, curve key times and takes.
+#
+#   import gameAnimExport.verify as verify
+#   verify.check("Hero@Walk.fbx", [1, 30], 24, joints=52)
+
+import re
+import mmap
+import struct
+
+TICKS = 46186158000 # FBX time units in a second
+FPS = {"game" : 15, "film" : 24, "pal" : 25, "ntsc" : 30, "show" : 48, "palf" : 50, "ntscf" : 60,
+    "hour" : 1 / 3600.0, "min" : 1 / 60.0, "sec" : 1, "millisec" : 1000} # Named units. Others are "<rate>fps" or "<rate>df"
+BINARY = "Kaydara FBX Binary  \x00"
+
+def frameRate(unit):
+    """ Frames per second for a Maya time unit ("film", "ntsc", "29.97fps", "29.97df" ...). None if unknown """
+    if unit in FPS:
+        return FPS[unit]
+    match = re.match(r"^([\d\.]+)(fps|df)$", unit)
+    return float(match.group(1)) if match else None
+
+def inspect(path):
+    """
+    Scan an FBX file. Returns a dict of:
+    format, version, limbNodes (count), curves (count), maxKeys (most keys on a curve),
+    time (take start and end, in FBX time units) or None.
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            raise ValueError("File is empty: %s" % path)
+        try:
+            if data[:len(BINARY)] == BINARY:
+                return inspectBinary(data)
+            return inspectAscii(data)
+        finally:
+            data.close()
+
+ASCII_VERSION = re.compile(r"FBXVersion: (\d+)")
+ASCII_LIMB = re.compile(r"Model: [^,\n]*, \"Model::[^\"\n]*\", \"LimbNode\"")
+ASCII_KEYS = re.compile(r"KeyTime: \*(\d+)")
+ASCII_TAKE = re.compile(r"LocalTime: (-?\d+),(-?\d+)")
+ASCII_STACK = re.compile(r"P: \"LocalSt(?:art|op)\", \"KTime\", \"Time\", \"\",(-?\d+)")
+
+def inspectAscii(data):
+    version = ASCII_VERSION.search(data, 0, 4096) # In the header
+    keys = [int(m.group(1)) for m in ASCII_KEYS.finditer(data)]
+    takes = data.rfind("\nTakes:") # Takes come last. Search from the end
+    take = ASCII_TAKE.search(data, takes) if takes != -1 else None
+    if take:
+        time = (int(take.group(1)), int(take.group(2)))
+    else: # No takes section. Try the animation stack
+        stack = [int(m.group(1)) for m in ASCII_STACK.finditer(data)][:2]
+        time = tuple(stack) if len(stack) == 2 else None
+    return {
+        "format"    : "ascii",
+        "version"   : int(version.group(1)) if version else None,
+        "limbNodes" : sum(1 for m in ASCII_LIMB.finditer(data)),
+        "curves"    : len(keys),
+        "maxKeys"   : max(keys or [0]),
+        "time"      : time
+        }
+
+def inspectBinary(data):
+    version = struct.unpack_from("<I", data, 23)[0]
+    wide = 7500 <= version # 64 bit offsets
+    header = struct.Struct("<QQQB" if wide else "<IIIB")
+    result = {
+        "format"    : "binary",
+        "version"   : version,
+        "limbNodes" : 0,
+        "curves"    : 0,
+        "maxKeys"   : 0,
+        "time"      : None
+        }
+    def walk(offset, end, path):
+        """ Visit node records between offsets """
+        while offset < end:
+            nodeEnd, count, length, nameLength = header.unpack_from(data, offset)
+            if not nodeEnd: # Null record ends a list
+                return
+            nameStart = offset + header.size
+            name = data[nameStart:nameStart + nameLength]
+            props = nameStart + nameLength
+            if path == ("Objects",) and name == "Model":
+                values = properties(props, count, 3)
+                if len(values) == 3 and values[2] == "LimbNode":
+                    result["limbNodes"] += 1
+            elif path == ("Objects", "AnimationCurve") and name == "KeyTime":
+                keys = struct.unpack_from("<I", data, props + 1)[0] # Array length, no need to decompress
+                result["curves"] += 1
+                result["maxKeys"] = max(result["maxKeys"], keys)
+            elif path == ("Takes", "Take") and name == "LocalTime" and result["time"] is None:
+                values = properties(props, count, 2)
+                if len(values) == 2:
+                    result["time"] = tuple(values)
+            elif path + (name,) in DESCEND:
+                walk(props + length, nodeEnd, path + (name,))
+            offset = nodeEnd
+    def properties(offset, count, limit):
+        """ Read the first few simple properties of a node """
+        values = []
+        for i in range(min(count, limit)):
+            kind = data[offset]
+            offset += 1
+            if kind in "SR":
+                size = struct.unpack_from("<I", data, offset)[0]
+                values.append(data[offset + 4:offset + 4 + size])
+                offset += 4 + size
+            elif kind in SCALARS:
+                values.append(struct.unpack_from(SCALARS[kind], data, offset)[0])
+                offset += struct.calcsize(SCALARS[kind])
+            else: # Arrays, not needed here
+                break
+        return values
+    walk(27, len(data), ())
+    return result
+
+SCALARS = {"Y" : "<h", "C" : "<?", "I" : "<i", "F" : "<f", "D" : "<d", "L" : "<q"}
+DESCEND = set([("Objects",), ("Objects", "AnimationCurve"), ("Takes",), ("Takes", "Take")]) # Nodes worth looking inside
+
+def check(path, frameRange, fps, joints=None, reduced=False):
+    """
+    Compare an exported file with what was asked for. Returns a list of problems, empty if it looks right.
+    frameRange: [start, end] of the animation, fps: frames per second (None skips the take's span),
+    joints: skeleton nodes expected, reduced: keys were thinned out, so curves can have fewer keys than frames.
+    """
+    try:
+        info = inspect(path)
+    except (IOError, ValueError, struct.error, IndexError) as e:
+        return ["Could not read the file: %s" % e]
+    problems = []
+    if info["time"] is None:
+        problems.append("No animation take found.")
+    elif fps:
+        span = [int(round(t * fps / float(TICKS))) for t in info["time"]]
+        if span != list(frameRange):
+            problems.append("Take covers frames %s - %s, not %s - %s." % tuple(span + list(frameRange)))
+    if joints and info["limbNodes"] != joints:
+        problems.append("Found %s skeleton nodes, expected %s." % (info["limbNodes"], joints))
+    frames = frameRange[1] - frameRange[0] + 1
+    if frames < info["maxKeys"] or (not reduced and 1 < info["maxKeys"] < frames): # Constant curves are reduced to a key or so
+        problems.append("Curves have up to %s keys, expected %s (one per frame)." % (info["maxKeys"], frames))
+    return problems